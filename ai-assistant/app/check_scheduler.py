@@ -0,0 +1,71 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+class CheckScheduler:
+    # When each location should be checked next, in a min-heap ordered by due time. Rescheduling a
+    # location pushes a new entry; the old one is skipped once it reaches the top because its due
+    # time no longer matches `_due`. At most `max_locations` are kept: scheduling one more drops the
+    # location that was scheduled least recently, like the feature store's LRU eviction.
+    def __init__(self, max_locations: int = 10000):
+        self.max_locations = max_locations
+        self._heap: List[Tuple[float, str]] = []
+        self._due: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.handed_out = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, location_id: str, delay_s: float, now: Optional[float] = None):
+        due = (time.time() if now is None else now) + delay_s
+        with self._lock:
+            self._due[location_id] = due
+            self._due.move_to_end(location_id)
+            if len(self._due) > self.max_locations:
+                # Its heap entry goes stale and is skipped like a rescheduled one
+                self._due.popitem(last=False)
+                self.evictions += 1
+            heapq.heappush(self._heap, (due, location_id))
+            self.scheduled += 1
+            # Drop stale entries once they make up most of the heap
+            if len(self._heap) > 2 * len(self._due) + 1024:
+                self._heap = [(when, location) for location, when in self._due.items()]
+                heapq.heapify(self._heap)
+
+    def pop_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        # Removes and returns (locationId, seconds overdue) for every location that is due, most
+        # overdue first. A location is back in the queue once its next decision is made.
+        now = time.time() if now is None else now
+        due_locations = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(due_locations) < limit):
+                due, location_id = heapq.heappop(self._heap)
+                if self._due.get(location_id) != due:
+                    continue
+                del self._due[location_id]
+                due_locations.append((location_id, now - due))
+            self.handed_out += len(due_locations)
+        return due_locations
+
+    def next_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] - now if self._heap else None
+
+    def stats(self) -> dict:
+        return {
+            "locations": len(self._due),
+            "max_locations": self.max_locations,
+            "evictions": self.evictions,
+            "heap_entries": len(self._heap),
+            "scheduled": self.scheduled,
+            "handed_out": self.handed_out,
+        }
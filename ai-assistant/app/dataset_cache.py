@@ -0,0 +1,223 @@
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Column layouts of the supported history files: sensor columns, the divisor that brings soil
+# moisture to the service's scale (the training CSV stores raw readings, see SOIL_MOISTURE_DIVISOR
+# in train_pump_model.py) and the pump label column, if the file has one.
+HISTORY_FORMATS = {
+    'csv': (['Soil Moisture', 'Temperature', 'Air Humidity'], 12.0, 'Pump Data'),
+    'record': (['soilMoisture', 'temperature', 'humidity'], 1.0, None),
+}
+
+# One raw little-endian file per column; `pump` is -1 for rows without a label
+COLUMNS = {
+    'soil_moisture': np.dtype('<f8'),
+    'temperature': np.dtype('<f8'),
+    'humidity': np.dtype('<f8'),
+    'pump': np.dtype('i1'),
+}
+SENSOR_COLUMNS = ['soil_moisture', 'temperature', 'humidity']
+DEFAULT_CHUNK_SIZE = 100_000
+FINGERPRINT_BYTES = 65536
+
+
+def detect_format(path: str) -> str:
+    header = pd.read_csv(path, nrows=0).columns
+    for name, (columns, _, _) in HISTORY_FORMATS.items():
+        if all(column in header for column in columns):
+            return name
+    raise ValueError(f"{path}: expected columns {[spec[0] for spec in HISTORY_FORMATS.values()]}, got {list(header)}")
+
+
+def _prefix_hash(path: str, length: int) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(min(length, FINGERPRINT_BYTES))).hexdigest()
+
+
+class _BoundedReader(io.RawIOBase):
+    # Exposes the bytes of `f` up to `end`, so rows appended while we read are left for the next ingest
+    def __init__(self, f, end: int):
+        self._f = f
+        self._end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        remaining = self._end - self._f.tell()
+        if remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:remaining]
+        return self._f.readinto(view)
+
+
+class DatasetCache:
+    # Cleaned sensor history stored column by column in a directory, read back with np.memmap.
+    # Each source file is remembered by the byte offset up to which it was ingested, so a growing
+    # history file only costs parsing its new rows.
+    def __init__(self, path: str):
+        self.path = path
+        self._meta = self._read_meta()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+    @property
+    def rows(self) -> int:
+        return self._meta['rows']
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'rows': 0, 'columns': {name: dtype.str for name, dtype in COLUMNS.items()}, 'sources': {}}
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(f'{meta_path}.tmp', 'w') as f:
+            json.dump(self._meta, f, indent=2)
+        os.replace(f'{meta_path}.tmp', meta_path)
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f'{name}.bin')
+
+    # --- Ingestion ---
+
+    def ingest(self, source: str, history_format: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        os.makedirs(self.path, exist_ok=True)
+        source_key = os.path.abspath(source)
+        history_format = history_format or detect_format(source)
+        sensor_columns, divisor, label_column = HISTORY_FORMATS[history_format]
+        state = self._meta['sources'].get(source_key)
+        size = os.path.getsize(source)
+        if state is not None:
+            if state['format'] != history_format:
+                raise ValueError(f"{source} was ingested as '{state['format']}', not '{history_format}'")
+            if size < state['offset'] or _prefix_hash(source, state['offset']) != state['prefix_sha1']:
+                raise ValueError(f"{source} changed since it was ingested (not just appended to); rebuild the cache")
+            if size == state['offset']:
+                return 0
+
+        self._truncate_to_rows()
+        added = 0
+        with open(source, 'rb') as f:
+            header = f.readline().decode('utf-8').strip().split(',')
+            start = state['offset'] if state is not None else f.tell()
+            end = self._last_complete_line(f, size)
+            f.seek(start)
+            if end > start:
+                reader = pd.read_csv(io.BufferedReader(_BoundedReader(f, end)), header=None, names=header,
+                                     usecols=sensor_columns + ([label_column] if label_column else []),
+                                     chunksize=chunk_size)
+                for chunk in reader:
+                    added += self._append(chunk, sensor_columns, divisor, label_column)
+
+        self._meta['rows'] += added
+        self._meta['sources'][source_key] = {
+            'format': history_format,
+            'offset': end,
+            'prefix_sha1': _prefix_hash(source, end),
+            'rows': (state['rows'] if state is not None else 0) + added,
+            'ingested_at': time.time(),
+        }
+        self._write_meta()
+        return added
+
+    @staticmethod
+    def _last_complete_line(f, size: int) -> int:
+        # Offset just past the last newline; a partially written last row is picked up next time
+        position = size
+        while position > 0:
+            block_start = max(0, position - 4096)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            position = block_start
+        return 0
+
+    def _append(self, chunk: pd.DataFrame, sensor_columns, divisor: float, label_column: Optional[str]) -> int:
+        # Same cleaning as the trainer: drop rows with missing/infinite values, rescale soil moisture
+        required = sensor_columns + ([label_column] if label_column else [])
+        values = chunk[required].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        values = values[np.isfinite(values).all(axis=1)]
+        if not len(values):
+            return 0
+        columns = {
+            'soil_moisture': values[:, 0] / divisor,
+            'temperature': values[:, 1],
+            'humidity': values[:, 2],
+            'pump': values[:, 3] if label_column else np.full(len(values), -1),
+        }
+        for name, dtype in COLUMNS.items():
+            with open(self._column_path(name), 'ab') as f:
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        return len(values)
+
+    def _truncate_to_rows(self):
+        # Drops bytes of an append that was interrupted before meta.json recorded it
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            expected = self.rows * dtype.itemsize
+            if os.path.exists(path) and os.path.getsize(path) > expected:
+                with open(path, 'r+b') as f:
+                    f.truncate(expected)
+
+    # --- Reading ---
+
+    def column(self, name: str) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._column_path(name), dtype=COLUMNS[name], mode='r', shape=(self.rows,))
+
+    def sensors(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        return np.column_stack([self.column(name)[start:stop] for name in SENSOR_COLUMNS])
+
+    def iter_ranges(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+        for start in range(0, self.rows, chunk_size):
+            yield start, min(start + chunk_size, self.rows)
+
+    def to_frame(self, start: int = 0, stop: Optional[int] = None, labelled_only: bool = True) -> pd.DataFrame:
+        # Rows in the trainer's column layout. The frame is flagged as already cleaned so the
+        # trainer does not drop/rescale it a second time.
+        names, _, label = HISTORY_FORMATS['csv']
+        stop = self.rows if stop is None else stop
+        pump = np.asarray(self.column('pump')[start:stop])
+        data = {column: np.asarray(self.column(name)[start:stop]) for column, name in zip(names, SENSOR_COLUMNS)}
+        data[label] = pump.astype(np.int64)
+        df = pd.DataFrame(data, index=pd.RangeIndex(start, stop))
+        if labelled_only:
+            df = df[pump >= 0]
+        df.attrs['cleaned'] = True
+        return df
+
+    def info(self) -> Dict[str, object]:
+        return {'path': self.path, 'rows': self.rows, 'sources': self._meta['sources']}
+
+
+if __name__ == "__main__":
+    # e.g.: python -m app.dataset_cache data/data.csv exports/records.csv --cache data/cache
+    parser = argparse.ArgumentParser(description="Ingest sensor history CSVs into the columnar dataset cache.")
+    parser.add_argument('sources', nargs='+', help="History CSV files (training data or record exports)")
+    parser.add_argument('--cache', required=True, help="Cache directory")
+    parser.add_argument('--format', choices=sorted(HISTORY_FORMATS), default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    cache = DatasetCache(args.cache)
+    for source in args.sources:
+        started = time.perf_counter()
+        added = cache.ingest(source, args.format, args.chunk_size)
+        print(f"{source}: {added} new row(s) in {time.perf_counter() - started:.2f}s")
+    print(f"{args.cache}: {cache.rows} row(s) total")
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from .rule_engine import rule_signature
+except ImportError:
+    from rule_engine import rule_signature
+
+
+class DecisionCache:
+    # LRU + TTL cache of final decisions. Sensor values are quantized to `resolution`
+    # (0 = exact match); rule outcomes are part of the key so only the ML answer can be shared
+    # across a quantization step, never a threshold crossing.
+    def __init__(self, max_size: int = 10000, ttl_s: float = 60.0, resolution: float = 0.1):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.resolution = resolution
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _quantize(self, value: float):
+        if self.resolution > 0:
+            return round(value / self.resolution)
+        return value
+
+    def make_key(self, sensor_data, config, *extra):
+        return (
+            self._quantize(sensor_data.soilMoisture),
+            self._quantize(sensor_data.temperature),
+            self._quantize(sensor_data.humidity),
+            config.moistureThreshold, config.tempMin, config.tempMax, config.humidityMax,
+            rule_signature(sensor_data, config),
+        ) + extra
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl_s
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl_s,
+                "resolution": self.resolution,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,141 @@
+import json
+import math
+import struct
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+from .rule_engine import (
+    ACTION_PUMP_ON, ACTION_PUMP_OFF, ACTION_FAN_ON, ACTION_FAN_OFF,
+    URGENCY_NORMAL, URGENCY_URGENT,
+    DEFAULT_PUMP_DURATION_S, DEFAULT_FAN_DURATION_S, URGENT_PUMP_DURATION_S, URGENT_FAN_DURATION_S
+)
+
+# A decision is a plain tuple in CombinedDecisionResponse field order:
+# (pump_action, pump_duration, pump_urgency, fan_action, fan_duration, fan_urgency)
+Decision = Tuple[str, int, str, str, int, str]
+DECISION_FIELDS = ('pump_action', 'pump_duration', 'pump_urgency', 'fan_action', 'fan_duration', 'fan_urgency')
+# What is sent back: the decision followed by the next-check hint in seconds (None when disabled).
+# Decisions are cached, hints are not, as they also depend on the location's recent trend.
+DecisionResult = Tuple[str, int, str, str, int, str, Optional[int]]
+RESULT_FIELDS = DECISION_FIELDS + ('next_check_s',)
+
+PUMP_OFF = (ACTION_PUMP_OFF, 0, URGENCY_NORMAL)
+PUMP_URGENT = (ACTION_PUMP_ON, URGENT_PUMP_DURATION_S, URGENCY_URGENT)
+FAN_OFF = (ACTION_FAN_OFF, 0, URGENCY_NORMAL)
+FAN_URGENT = (ACTION_FAN_ON, URGENT_FAN_DURATION_S, URGENCY_URGENT)
+
+
+class DecisionInput:
+    # One decision request as a flat record. Attribute names match SensorData/ConfigurationData so
+    # the record can be passed wherever the rule engine or the cache key expects either model.
+    __slots__ = ('locationId', 'soilMoisture', 'temperature', 'humidity', 'moistureThreshold', 'tempMin',
+                 'tempMax', 'humidityMax', 'modelName', 'pumpDuration', 'fanDuration')
+
+    def __init__(self, locationId: str, soilMoisture: float, temperature: float, humidity: float,
+                 moistureThreshold: float, tempMin: Optional[float], tempMax: float, humidityMax: float,
+                 modelName: Optional[str] = None, pumpDuration: int = DEFAULT_PUMP_DURATION_S,
+                 fanDuration: int = DEFAULT_FAN_DURATION_S):
+        self.locationId = locationId
+        self.soilMoisture = soilMoisture
+        self.temperature = temperature
+        self.humidity = humidity
+        self.moistureThreshold = moistureThreshold
+        self.tempMin = tempMin
+        self.tempMax = tempMax
+        self.humidityMax = humidityMax
+        self.modelName = modelName
+        self.pumpDuration = pumpDuration
+        self.fanDuration = fanDuration
+
+    def astuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_request(cls, request) -> "DecisionInput":
+        sensor, config = request.sensorData, request.configuration
+        return cls(request.locationId, sensor.soilMoisture, sensor.temperature, sensor.humidity,
+                   config.moistureThreshold, config.tempMin, config.tempMax, config.humidityMax, request.modelName,
+                   getattr(config, 'pumpDuration', DEFAULT_PUMP_DURATION_S),
+                   getattr(config, 'fanDuration', DEFAULT_FAN_DURATION_S))
+
+
+# --- JSON: results only take a handful of distinct values, so their encodings are memoized ---
+
+@lru_cache(maxsize=1024)
+def encode_json(result: DecisionResult) -> bytes:
+    return json.dumps(dict(zip(RESULT_FIELDS, result)), separators=(',', ':')).encode()
+
+
+def encode_json_list(results: Iterable[DecisionResult]) -> bytes:
+    return b'[' + b','.join(map(encode_json, results)) + b']'
+
+
+# --- Compact binary encoding (POST /decide/bin, Content-Type application/x-decision) ---
+#
+# Request, little-endian: version u8, flags u8, locationId length u16, modelName length u16,
+# then soilMoisture, temperature, humidity, moistureThreshold, tempMin, tempMax, humidityMax as
+# float64, then the UTF-8 locationId and modelName bytes. Flag bit 0 marks tempMin as present.
+# Response: pump on u8, pump urgent u8, fan on u8, fan urgent u8, pump duration u32, fan duration u32,
+# next check u32 (seconds, 0 when there is no hint).
+
+BINARY_MEDIA_TYPE = 'application/x-decision'
+BINARY_VERSION = 1
+FLAG_TEMP_MIN = 0x01
+REQUEST_HEADER = struct.Struct('<BBHH7d')
+RESPONSE_LAYOUT = struct.Struct('<BBBBIII')
+
+
+class BinaryDecodeError(ValueError):
+    pass
+
+
+def decode_request(body: bytes) -> DecisionInput:
+    if len(body) < REQUEST_HEADER.size:
+        raise BinaryDecodeError(f"Body is {len(body)} bytes, the header alone is {REQUEST_HEADER.size}")
+    (version, flags, location_length, model_length, soil_moisture, temperature, humidity,
+     moisture_threshold, temp_min, temp_max, humidity_max) = REQUEST_HEADER.unpack_from(body)
+    if version != BINARY_VERSION:
+        raise BinaryDecodeError(f"Unsupported version {version}, expected {BINARY_VERSION}")
+    if flags & ~FLAG_TEMP_MIN:
+        raise BinaryDecodeError(f"Unknown flags 0x{flags:02x}")
+    expected_length = REQUEST_HEADER.size + location_length + model_length
+    if len(body) != expected_length:
+        raise BinaryDecodeError(f"Body is {len(body)} bytes, header declares {expected_length}")
+    has_temp_min = bool(flags & FLAG_TEMP_MIN)
+    values = (soil_moisture, temperature, humidity, moisture_threshold, temp_max, humidity_max) + (
+        (temp_min,) if has_temp_min else ())
+    if not all(math.isfinite(value) for value in values):
+        raise BinaryDecodeError("Sensor and configuration values must be finite numbers")
+    try:
+        offset = REQUEST_HEADER.size
+        location_id = body[offset:offset + location_length].decode('utf-8')
+        offset += location_length
+        model_name = body[offset:offset + model_length].decode('utf-8') if model_length else None
+    except UnicodeDecodeError as e:
+        raise BinaryDecodeError(f"locationId/modelName are not valid UTF-8: {e}")
+    return DecisionInput(location_id, soil_moisture, temperature, humidity, moisture_threshold,
+                         temp_min if has_temp_min else None, temp_max, humidity_max, model_name)
+
+
+def encode_request(reading: DecisionInput) -> bytes:
+    location = reading.locationId.encode('utf-8')
+    model = (reading.modelName or '').encode('utf-8')
+    has_temp_min = reading.tempMin is not None
+    return REQUEST_HEADER.pack(
+        BINARY_VERSION, FLAG_TEMP_MIN if has_temp_min else 0, len(location), len(model),
+        reading.soilMoisture, reading.temperature, reading.humidity, reading.moistureThreshold,
+        reading.tempMin if has_temp_min else 0.0, reading.tempMax, reading.humidityMax) + location + model
+
+
+def encode_binary(result: DecisionResult) -> bytes:
+    return RESPONSE_LAYOUT.pack(
+        result[0] == ACTION_PUMP_ON, result[2] == URGENCY_URGENT,
+        result[3] == ACTION_FAN_ON, result[5] == URGENCY_URGENT, result[1], result[4], result[6] or 0)
+
+
+def decode_response(data: bytes) -> DecisionResult:
+    pump_on, pump_urgent, fan_on, fan_urgent, pump_duration, fan_duration, next_check_s = RESPONSE_LAYOUT.unpack(data)
+    return (ACTION_PUMP_ON if pump_on else ACTION_PUMP_OFF, pump_duration,
+            URGENCY_URGENT if pump_urgent else URGENCY_NORMAL,
+            ACTION_FAN_ON if fan_on else ACTION_FAN_OFF, fan_duration,
+            URGENCY_URGENT if fan_urgent else URGENCY_NORMAL, next_check_s or None)
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+BASE_FEATURES = ['Soil Moisture', 'Temperature', 'Air Humidity']
+EXTENDED_FEATURES = ['Moisture Slope', 'Moisture MA', 'Temperature MA', 'Humidity MA', 'Minutes Since Pump']
+ALL_FEATURES = BASE_FEATURES + EXTENDED_FEATURES
+
+DEFAULT_WINDOW = 30
+# Used when a location has never pumped (or pumped longer ago than this).
+MAX_MINUTES_SINCE_PUMP = 24 * 60.0
+
+
+def features_without_history(X: np.ndarray) -> np.ndarray:
+    # Extended features for base rows seen as a location's first reading: flat trend,
+    # averages equal to the reading itself and no recent pump.
+    X = np.asarray(X, dtype=float)
+    n = X.shape[0]
+    return np.column_stack([X, np.zeros(n), X, np.full(n, MAX_MINUTES_SINCE_PUMP)])
+
+
+class LocationHistory:
+    # Fixed-size ring buffer of the last `window` readings with running sums, so every update and
+    # every rolling feature is O(1). Times are minutes relative to the first reading.
+    __slots__ = ("window", "origin", "times", "moisture", "temperature", "humidity", "index", "count",
+                 "sum_t", "sum_tt", "sum_m", "sum_tm", "sum_temp", "sum_hum", "updates", "last_pump_at")
+
+    def __init__(self, window: int, origin: float):
+        self.window = window
+        self.origin = origin
+        self.times = [0.0] * window
+        self.moisture = [0.0] * window
+        self.temperature = [0.0] * window
+        self.humidity = [0.0] * window
+        self.index = 0
+        self.count = 0
+        self.sum_t = self.sum_tt = self.sum_m = self.sum_tm = self.sum_temp = self.sum_hum = 0.0
+        self.updates = 0
+        self.last_pump_at: Optional[float] = None
+
+    def add(self, now: float, soil_moisture: float, temperature: float, humidity: float):
+        t = (now - self.origin) / 60.0
+        i = self.index
+        if self.count == self.window:
+            old_t, old_m = self.times[i], self.moisture[i]
+            self.sum_t -= old_t
+            self.sum_tt -= old_t * old_t
+            self.sum_m -= old_m
+            self.sum_tm -= old_t * old_m
+            self.sum_temp -= self.temperature[i]
+            self.sum_hum -= self.humidity[i]
+        else:
+            self.count += 1
+        self.times[i] = t
+        self.moisture[i] = soil_moisture
+        self.temperature[i] = temperature
+        self.humidity[i] = humidity
+        self.sum_t += t
+        self.sum_tt += t * t
+        self.sum_m += soil_moisture
+        self.sum_tm += t * soil_moisture
+        self.sum_temp += temperature
+        self.sum_hum += humidity
+        self.index = (i + 1) % self.window
+
+        # Subtracting old values accumulates rounding error; rebuild the sums once per window.
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self._rebuild_sums()
+
+    def _rebuild_sums(self):
+        n = self.count
+        times, moisture = self.times[:n], self.moisture[:n]
+        self.sum_t = sum(times)
+        self.sum_tt = sum(t * t for t in times)
+        self.sum_m = sum(moisture)
+        self.sum_tm = sum(t * m for t, m in zip(times, moisture))
+        self.sum_temp = sum(self.temperature[:n])
+        self.sum_hum = sum(self.humidity[:n])
+
+    def features(self, now: float) -> Tuple[float, float, float, float, float]:
+        n = self.count
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        # Least-squares moisture slope over the window, in moisture units per minute.
+        slope = (n * self.sum_tm - self.sum_t * self.sum_m) / denominator if n > 1 and denominator > 1e-9 else 0.0
+        if self.last_pump_at is None:
+            minutes_since_pump = MAX_MINUTES_SINCE_PUMP
+        else:
+            minutes_since_pump = min((now - self.last_pump_at) / 60.0, MAX_MINUTES_SINCE_PUMP)
+        return (slope, self.sum_m / n, self.sum_temp / n, self.sum_hum / n, minutes_since_pump)
+
+
+class FeatureStore:
+    # Recent readings per locationId, bounded by `max_locations` with LRU eviction of inactive ones.
+    def __init__(self, window: int = DEFAULT_WINDOW, max_locations: int = 10000):
+        self.window = window
+        self.max_locations = max_locations
+        self._histories: "OrderedDict[str, LocationHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    def update(self, location_id: str, soil_moisture: float, temperature: float, humidity: float,
+               now: Optional[float] = None) -> Tuple[float, ...]:
+        # Records the reading and returns the full feature vector (ALL_FEATURES order).
+        now = time.time() if now is None else now
+        with self._lock:
+            history = self._histories.get(location_id)
+            if history is None:
+                history = self._histories[location_id] = LocationHistory(self.window, now)
+                if len(self._histories) > self.max_locations:
+                    self._histories.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._histories.move_to_end(location_id)
+            history.add(now, soil_moisture, temperature, humidity)
+            return (soil_moisture, temperature, humidity) + history.features(now)
+
+    def record_pump(self, location_id: str, now: Optional[float] = None):
+        with self._lock:
+            history = self._histories.get(location_id)
+            if history is not None:
+                history.last_pump_at = time.time() if now is None else now
+
+    def stats(self) -> dict:
+        return {
+            "locations": len(self._histories),
+            "max_locations": self.max_locations,
+            "window": self.window,
+            "evictions": self.evictions,
+        }
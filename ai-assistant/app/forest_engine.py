@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class CompiledScaler:
+    def __init__(self, mean, scale, feature_names=None):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.feature_names_in_ = feature_names
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class CompiledForest:
+    # All trees are packed into flat node arrays; leaves point to themselves, so
+    # `max_depth` synchronous steps bring every (tree, sample) pair to its leaf.
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, classes, max_depth):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.children_left = np.asarray(children_left, dtype=np.intp)
+        self.children_right = np.asarray(children_right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(self.feature.max()) + 1 if self.feature.size else 0
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds; do the same.
+        X = np.asarray(X, dtype=np.float32)
+        n_samples = X.shape[0]
+        rows = np.arange(n_samples)[None, :]
+        node = np.repeat(self.roots[:, None], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.children_left[node], self.children_right[node])
+        return node
+
+    def predict_proba(self, X):
+        return self.value[self.apply(X)].mean(axis=0)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def load_compiled_forest(path):
+    with np.load(path, allow_pickle=False) as data:
+        feature_names = data['feature_names'] if 'feature_names' in data.files else None
+        scaler = CompiledScaler(data['scaler_mean'], data['scaler_scale'], feature_names)
+        model = CompiledForest(
+            feature=data['feature'],
+            threshold=data['threshold'],
+            children_left=data['children_left'],
+            children_right=data['children_right'],
+            value=data['value'],
+            roots=data['roots'],
+            classes=data['classes'],
+            max_depth=data['max_depth'],
+        )
+    return scaler, model
@@ -0,0 +1,173 @@
+import asyncio
+import time
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import REGISTRY as METRICS_REGISTRY, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+INFERENCE_BATCH_SIZE = METRICS_REGISTRY.histogram(
+    "inference_batch_size", "Rows per vectorized model call from the inference pool.", buckets=BATCH_SIZE_BUCKETS)
+INFERENCE_REJECTED_TOTAL = METRICS_REGISTRY.counter(
+    "inference_rejected_total", "Requests rejected with 503 because the inference queue was full.")
+
+
+class InferenceQueueFull(Exception):
+    pass
+
+
+class InferenceStopped(RuntimeError):
+    pass
+
+
+class BatchingPredictor:
+    # Runs model inference on a bounded thread pool so the event loop never blocks on predict().
+    # Single-row requests that arrive while a batch is running are queued and sent together as
+    # one vectorized call per model; when the pool is idle a request is flushed immediately.
+    def __init__(self, max_workers: int = 2, batch_window_s: float = 0.002, max_batch_size: int = 256,
+                 max_queue_depth: int = 1024):
+        self.max_workers = max_workers
+        self.batch_window_s = batch_window_s
+        self.max_batch_size = max_batch_size
+        self.max_queue_depth = max_queue_depth
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Tuple[object, str, Sequence[float], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._inflight_batches = 0
+        self._depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def start(self):
+        # Called from the app's startup hook, i.e. after any pre-fork model loading.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def check_capacity(self, weight: int = 1) -> int:
+        # Raises InferenceQueueFull unless `weight` more rows fit. Work heavier than the whole queue
+        # (a large batch) counts as a full queue: it is admitted when the queue is empty.
+        weight = min(weight, self.max_queue_depth)
+        if self._depth + weight > self.max_queue_depth:
+            INFERENCE_REJECTED_TOTAL.inc()
+            raise InferenceQueueFull(f"Inference queue is full ({self._depth}/{self.max_queue_depth})")
+        return weight
+
+    def _acquire(self, weight: int = 1) -> int:
+        weight = self.check_capacity(weight)
+        self._depth += weight
+        return weight
+
+    @contextmanager
+    def reserve(self, weight: int = 1):
+        # Holds queue capacity for work that is submitted later with execute(), so a request that
+        # would be rejected is rejected before it has done anything else.
+        weight = self._acquire(weight)
+        try:
+            yield
+        finally:
+            self._depth -= weight
+
+    async def predict(self, bundle, features: Sequence[float], endpoint: str = "decide"):
+        # `endpoint` labels the scaling/prediction/lookup stage timings of the batch this row joins
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self._pending.append((bundle, endpoint, features, future))
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                if self._inflight_batches == 0:
+                    self._flush_handle = loop.call_soon(self._flush)
+                else:
+                    self._flush_handle = loop.call_later(self.batch_window_s, self._flush)
+            return await future
+        finally:
+            self._depth -= 1
+
+    async def run(self, fn: Callable, *args, weight: int = 1):
+        # Run arbitrary (already vectorized) work on the pool, counted against the queue limit.
+        with self.reserve(weight):
+            return await self.execute(fn, *args)
+
+    async def execute(self, fn: Callable, *args):
+        # Same as run() without the queue accounting, for callers holding a reserve()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        batch = [item for item in batch if not item[3].done()]
+        if not batch:
+            return
+
+        # One call per model and endpoint, so stage timings are recorded under the right endpoint
+        groups: Dict[Tuple[int, str], Tuple[object, str, list]] = {}
+        for bundle, endpoint, features, future in batch:
+            groups.setdefault((id(bundle), endpoint), (bundle, endpoint, []))[2].append((features, future))
+
+        loop = asyncio.get_running_loop()
+        for bundle, endpoint, items in groups.values():
+            self._inflight_batches += 1
+            rows = np.array([features for features, _ in items], dtype=float)
+            task = loop.run_in_executor(self._executor, _predict_rows, bundle, rows, endpoint)
+            task.add_done_callback(lambda done, items=items: self._on_batch_done(done, items))
+
+    def _on_batch_done(self, done: asyncio.Future, items: list):
+        self._inflight_batches -= 1
+        # stop() cancels batches that have not started; their requests fail instead of waiting forever
+        error = InferenceStopped("Inference pool stopped") if done.cancelled() else done.exception()
+        if error is None:
+            predictions = done.result()
+        for i, (_, future) in enumerate(items):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(predictions[i])
+        # Whatever queued up while this batch was running goes out now as the next batch.
+        if self._pending and self._inflight_batches == 0:
+            self._flush()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self._depth,
+            "max_queue_depth": self.max_queue_depth,
+            "inflight_batches": self._inflight_batches,
+            "batch_window_ms": self.batch_window_s * 1000,
+            "max_batch_size": self.max_batch_size,
+            "rejected": INFERENCE_REJECTED_TOTAL.value(),
+        }
+
+
+def _predict_rows(bundle, rows: np.ndarray, endpoint: str = "decide") -> np.ndarray:
+    INFERENCE_BATCH_SIZE.observe(len(rows))
+    started = time.perf_counter()
+    if bundle.lookup is not None:
+        predictions = bundle.predict(rows)
+        STAGE_SECONDS.observe(time.perf_counter() - started, endpoint, "lookup")
+        return predictions
+    features_scaled = bundle.transform(rows)
+    scaled = time.perf_counter()
+    predictions = bundle.predict_scaled(features_scaled)
+    STAGE_SECONDS.observe(scaled - started, endpoint, "scaling")
+    STAGE_SECONDS.observe(time.perf_counter() - scaled, endpoint, "prediction")
+    return predictions
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+from typing import Callable, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Soil moisture (%), temperature (°C), humidity (%) covered by the grid; anything outside goes to the model.
+DEFAULT_BOUNDS = ((0.0, 100.0), (-10.0, 60.0), (0.0, 100.0))
+DEFAULT_STEP = 1.0
+BUILD_CHUNK_CELLS = 65536
+
+
+def artifact_fingerprint(paths: Iterable[str]) -> str:
+    # Content hash of a model's artifact files: a table is only reused for the exact model it was
+    # built from, however few grid cells a retrained model changes (and whatever the file times).
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class LookupTable:
+    # Pump predictions of one model evaluated at every point of a regular 3-D grid. A reading is
+    # answered by the nearest grid point, so a prediction is an index computation plus an array read.
+    def __init__(self, table: np.ndarray, lower: Sequence[float], step: Sequence[float],
+                 disagreement: Optional[float] = None, fingerprint: Optional[str] = None):
+        self.table = table
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.step = np.asarray(step, dtype=np.float64)
+        self.shape = np.asarray(table.shape, dtype=np.intp)
+        self.disagreement = disagreement
+        # artifact_fingerprint() of the model the table was built from
+        self.fingerprint = fingerprint
+
+    @property
+    def upper(self) -> np.ndarray:
+        return self.lower + (self.shape - 1) * self.step
+
+    @classmethod
+    def build(cls, predict: Callable[[np.ndarray], np.ndarray], bounds=DEFAULT_BOUNDS, step: float = DEFAULT_STEP,
+              chunk_cells: int = BUILD_CHUNK_CELLS) -> "LookupTable":
+        lower = np.array([low for low, _ in bounds], dtype=np.float64)
+        steps = np.full(len(bounds), step, dtype=np.float64)
+        shape = tuple(int(round((high - low) / step)) + 1 for low, high in bounds)
+        table = np.empty(int(np.prod(shape)), dtype=np.uint8)
+        # Evaluated in chunks of cells so memory stays bounded for fine grids
+        for start in range(0, table.size, chunk_cells):
+            cells = np.arange(start, min(start + chunk_cells, table.size))
+            points = lower + np.column_stack(np.unravel_index(cells, shape)) * steps
+            table[cells] = predict(points)
+        return cls(table.reshape(shape), lower, steps)
+
+    def _locate(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with np.errstate(invalid='ignore'):
+            index = np.rint((X - self.lower) / self.step)
+            inside = ((index >= 0) & (index < self.shape)).all(axis=1)
+        return index[inside].astype(np.intp), inside
+
+    def covers(self, X: np.ndarray) -> bool:
+        # True if every row is answered from the grid (no fallback to the model)
+        return bool(self._locate(np.asarray(X, dtype=np.float64))[1].all())
+
+    def get(self, row: Sequence[float]) -> Optional[int]:
+        # Prediction for one reading, or None when it lies outside the grid
+        index = np.rint((np.asarray(row, dtype=np.float64) - self.lower) / self.step)
+        if not ((index >= 0) & (index < self.shape)).all():
+            return None
+        return int(self.table[tuple(index.astype(np.intp))])
+
+    def predict(self, X: np.ndarray, fallback: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        index, inside = self._locate(X)
+        predictions = np.empty(len(X), dtype=np.int64)
+        predictions[inside] = self.table[index[:, 0], index[:, 1], index[:, 2]]
+        if not inside.all():
+            predictions[~inside] = fallback(X[~inside])
+        return predictions
+
+    def measure_disagreement(self, predict: Callable[[np.ndarray], np.ndarray], samples: int = 100_000,
+                             seed: int = 0) -> float:
+        # Share of uniformly random in-bounds readings where the nearest grid point gives a
+        # different answer than the full model.
+        rng = np.random.default_rng(seed)
+        X = rng.uniform(self.lower, self.upper, size=(samples, len(self.lower)))
+        disagreement = float(np.mean(self.predict(X, predict) != np.asarray(predict(X))))
+        self.disagreement = disagreement
+        return disagreement
+
+    def matches(self, predict: Callable[[np.ndarray], np.ndarray], samples: int = 2000, seed: int = 0) -> bool:
+        # Spot check that a table read from disk reproduces the current model at its own grid
+        # points. Catches a table built for another model, not one that differs in a few cells.
+        rng = np.random.default_rng(seed)
+        index = np.column_stack([rng.integers(0, size, samples) for size in self.shape])
+        points = self.lower + index * self.step
+        return bool(np.array_equal(self.table[index[:, 0], index[:, 1], index[:, 2]], np.asarray(predict(points))))
+
+    def info(self) -> dict:
+        return {
+            "cells": int(self.table.size),
+            "bytes": int(self.table.nbytes),
+            "step": self.step.tolist(),
+            "lower": self.lower.tolist(),
+            "upper": self.upper.tolist(),
+            "disagreement": self.disagreement,
+            "fingerprint": self.fingerprint,
+        }
+
+    def save(self, path: str):
+        # `<path>` holds the raw table (memory-mappable .npy), `<path>.json` the grid definition.
+        # Both are written to temporary files and renamed, so a table that is currently mapped
+        # (or read by another worker) is never truncated underneath it.
+        with open(f"{path}.tmp", "wb") as f:
+            np.save(f, np.asarray(self.table))
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump({"lower": self.lower.tolist(), "step": self.step.tolist(),
+                       "disagreement": self.disagreement, "fingerprint": self.fingerprint}, f)
+        os.replace(f"{path}.tmp", path)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "LookupTable":
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        table = np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+        return cls(table, meta["lower"], meta["step"], meta.get("disagreement"), meta.get("fingerprint"))
+
+
+def load_or_build(path: str, predict: Callable[[np.ndarray], np.ndarray], step: float = DEFAULT_STEP,
+                  bounds=DEFAULT_BOUNDS, fingerprint: Optional[str] = None) -> LookupTable:
+    # `fingerprint` identifies the model (artifact_fingerprint()); a table on disk built from
+    # different artifacts is rebuilt.
+    expected_shape = tuple(int(round((high - low) / step)) + 1 for low, high in bounds)
+    if os.path.exists(path) and os.path.exists(f"{path}.json"):
+        try:
+            table = LookupTable.load(path)
+            if (table.fingerprint == fingerprint and table.table.shape == expected_shape
+                    and np.allclose(table.step, step) and np.allclose(table.lower, [low for low, _ in bounds])
+                    and table.matches(predict)):
+                logger.info(f"Using lookup table {path} ({table.table.size} cells)")
+                return table
+            logger.info(f"Lookup table {path} does not match the current model or grid, rebuilding")
+        except Exception as e:
+            logger.warning(f"Could not read lookup table {path}, rebuilding: {e}")
+
+    started = time.perf_counter()
+    table = LookupTable.build(predict, bounds, step)
+    table.fingerprint = fingerprint
+    disagreement = table.measure_disagreement(predict)
+    logger.info(f"Built lookup table ({table.table.size} cells, step {step}) in "
+                f"{time.perf_counter() - started:.2f}s; disagrees with the model on {disagreement:.2%} of readings")
+    try:
+        table.save(path)
+    except OSError as e:
+        logger.warning(f"Could not save lookup table to {path}: {e}")
+    return table
+
+
+if __name__ == "__main__":
+    # Build (or refresh) a model's table offline, e.g.: python -m app.lookup_table --model pump_random_forest
+    from .model_registry import ModelRegistry
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Precompute the pump decision lookup table for a model.")
+    parser.add_argument('--model-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models_trained'))
+    parser.add_argument('--model', default='pump_random_forest')
+    parser.add_argument('--step', type=float, default=DEFAULT_STEP, help="Grid spacing for all three inputs")
+    parser.add_argument('--samples', type=int, default=1_000_000, help="Random readings used to measure disagreement")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_dir, default_model=args.model, lookup_step=args.step)
+    registry.reload([args.model])
+    bundle = registry.get(args.model)
+    if bundle is None or bundle.lookup is None:
+        raise SystemExit(f"Could not build a lookup table for '{args.model}'")
+    bundle.lookup.measure_disagreement(bundle.predict_model, samples=args.samples)
+    bundle.lookup.save(registry.lookup_path(args.model))
+    print(json.dumps(bundle.lookup.info(), indent=2))
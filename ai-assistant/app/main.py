@@ -1,72 +1,311 @@
+import time
+# Start of the import phase, the reference point of the startup timing report
+_import_started = time.perf_counter()
+
 import os
+import gc
+import math
 import logging
-import joblib
+import threading
 import numpy as np
-from fastapi import FastAPI, HTTPException
-from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from typing import List, Optional, Tuple
 
 from .rule_engine import (
-    check_urgent_conditions,
-    check_normal_fan_conditions,
-    make_normal_pump_decision_rules,
-    ACTION_PUMP_ON, ACTION_FAN_ON, ACTION_NONE, ACTION_PUMP_OFF, ACTION_FAN_OFF,
-    URGENCY_NORMAL, URGENCY_URGENT,
-    DEFAULT_PUMP_DURATION_S, DEFAULT_FAN_DURATION_S
+    is_urgent_pump,
+    is_urgent_fan,
+    needs_fan,
+    needs_pump,
+    check_urgent_conditions_batch,
+    check_normal_fan_conditions_batch,
+    make_normal_pump_decision_rules_batch,
+    ACTION_PUMP_ON, ACTION_FAN_ON, ACTION_NONE, URGENCY_NORMAL
+)
+from .model_registry import ModelRegistry
+from .feature_store import FeatureStore, BASE_FEATURES
+from .inference_pool import BatchingPredictor, InferenceQueueFull, InferenceStopped
+from .metrics import (
+    REGISTRY as METRICS_REGISTRY, STAGE_SECONDS, DECISIONS_TOTAL, ML_FAILURES_TOTAL, ML_FALLBACKS_TOTAL,
+    RequestTimingMiddleware
+)
+from .decision_cache import DecisionCache
+from .next_check import NextCheckEstimator
+from .check_scheduler import CheckScheduler
+from .singleflight import SingleFlight
+from .service_logging import configure_logging, stop_logging, logging_stats, DecisionLog
+from .decision_core import (
+    Decision, DecisionResult, DecisionInput, PUMP_OFF, PUMP_URGENT, FAN_OFF, FAN_URGENT, BINARY_MEDIA_TYPE, BinaryDecodeError,
+    decode_request, encode_binary, encode_json, encode_json_list
+)
+from .models import (
+    DecisionRequest, CombinedDecisionResponse, ModelAssignment
 )
-from .models import DecisionRequest, SensorData, ConfigurationData, DecisionResponse, CombinedDecisionResponse
 
 APP_PORT = int(os.getenv('PORT', 8001))
 
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Records are written by a background thread (see service_logging.py); LOG_LEVEL sets the level
+configure_logging()
 logger = logging.getLogger(__name__)
 
-ml_model = None
-scaler = None
-
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(SCRIPT_DIR, '..', 'models_trained')
-MODEL_PATH = os.path.join(MODEL_DIR, 'pump_random_forest.joblib')
-SCALER_PATH = os.path.join(MODEL_DIR, 'pump_scaler.joblib')
+DEFAULT_MODEL_NAME = os.getenv('DEFAULT_MODEL', 'pump_random_forest')
+MODEL_WATCH_INTERVAL_S = float(os.getenv('MODEL_WATCH_INTERVAL_S', 10))
+READY_REQUIRES_MODEL = os.getenv('READY_REQUIRES_MODEL', '1') == '1'
+# 'sync' loads every model before the worker accepts traffic. 'background' starts answering at once
+# with the rule engine and loads the models in a thread; /decide switches to a model as soon as it
+# is loaded. Combine with READY_REQUIRES_MODEL=0 to also report ready while serving rules only.
+MODEL_LOAD_MODE = os.getenv('MODEL_LOAD_MODE', 'sync')
+if MODEL_LOAD_MODE not in ('sync', 'background'):
+    raise ValueError(f"MODEL_LOAD_MODE must be 'sync' or 'background', got '{MODEL_LOAD_MODE}'")
+
+service_ready = False
+# pending -> loading -> loaded (or failed); reported on /health
+model_load_state = "pending"
+# Seconds since _import_started at which each startup milestone was reached. In a worker forked from
+# a preloading gunicorn master, the master's milestones sit under "preload" and the worker's own are
+# counted from the fork.
+startup_timings = {}
+
+# Next-check hints on every decision (NEXT_CHECK_HINTS=0 leaves next_check_s empty). Each hint also
+# schedules the location in `check_scheduler`, which GET /schedule/due hands out once it is due.
+NEXT_CHECK_HINTS = os.getenv('NEXT_CHECK_HINTS', '1') == '1'
+
+# LOOKUP_TABLE_STEP > 0 precomputes pump predictions on a soil/temperature/humidity grid of that spacing.
+# With hints on, the soil moisture values where each model's pump prediction flips are computed while
+# the model loads, so estimating a hint never runs the model on the event loop.
+registry = ModelRegistry(MODEL_DIR, default_model=DEFAULT_MODEL_NAME, watch_interval_s=MODEL_WATCH_INTERVAL_S,
+                         lookup_step=float(os.getenv('LOOKUP_TABLE_STEP', 0)),
+                         lookup_dir=os.getenv('LOOKUP_TABLE_DIR') or None,
+                         pump_boundaries=NEXT_CHECK_HINTS)
+
+decision_cache = DecisionCache(
+    max_size=int(os.getenv('DECISION_CACHE_SIZE', 10000)),
+    ttl_s=float(os.getenv('DECISION_CACHE_TTL_S', 60)),
+    resolution=float(os.getenv('DECISION_CACHE_RESOLUTION', 0.1)),
+)
 
+# Rolling per-location features (trend, moving averages, time since last pump) for extended models.
+# The history is per worker: with several workers a location's readings and pumps are split between
+# them, so extended models need a single worker or routing by locationId (see gunicorn.conf.py).
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+feature_store = FeatureStore(
+    window=int(os.getenv('FEATURE_WINDOW', 30)),
+    max_locations=int(os.getenv('FEATURE_STORE_MAX_LOCATIONS', 10000)),
+)
 
-async def load_model_on_startup():
-    global ml_model, scaler
-    logger.info("--- Starting model and scaler loading ---")
-    try:
-        if os.path.exists(SCALER_PATH):
-            scaler = joblib.load(SCALER_PATH)
-            logger.info(f"Scaler loaded from: {SCALER_PATH}")
-        else:
-            logger.error(f"ERROR: Scaler file not found at {SCALER_PATH}.")
-            scaler = None
-
-        if scaler and os.path.exists(MODEL_PATH):
-            ml_model = joblib.load(MODEL_PATH)
-            logger.info(f"ML Model loaded from: {MODEL_PATH}")
-        elif scaler:
-            logger.error(f"ERROR: Model file not found at {MODEL_PATH}.")
-            ml_model = None
-        else:
-            ml_model = None
+# The next_check_s hint in each response is the contract that works with any number of workers.
+# The check scheduler is per worker (bounded like the feature store): /schedule/due only lists the
+# locations decided by the worker that answers it, so use it with WEB_CONCURRENCY=1 or sticky routing.
+next_check = NextCheckEstimator(
+    min_s=float(os.getenv('NEXT_CHECK_MIN_S', 30)),
+    max_s=float(os.getenv('NEXT_CHECK_MAX_S', 3600)),
+)
+check_scheduler = CheckScheduler(max_locations=int(os.getenv('CHECK_SCHEDULER_MAX_LOCATIONS', 10000)))
 
-    except Exception as e:
-        logger.exception(f"Critical error loading model or scaler: {e}")
-        ml_model = None
-        scaler = None
+# One `app.decisions` record per decision: every urgent one, a DECISION_LOG_SAMPLE_RATE share of the rest
+decision_log = DecisionLog(sample_rate=float(os.getenv('DECISION_LOG_SAMPLE_RATE', 0.01)))
+
+# Concurrent /decide and /decide/bin requests with the same location and identical payload (retries,
+# overlapping jobs) share one computation; DECISION_COALESCING=0 computes each one separately.
+DECISION_COALESCING = os.getenv('DECISION_COALESCING', '1') == '1'
+singleflight = SingleFlight()
+
+inference = BatchingPredictor(
+    max_workers=int(os.getenv('INFERENCE_WORKERS', 2)),
+    batch_window_s=float(os.getenv('INFERENCE_BATCH_WINDOW_MS', 2)) / 1000.0,
+    max_batch_size=int(os.getenv('INFERENCE_MAX_BATCH', 256)),
+    max_queue_depth=int(os.getenv('INFERENCE_MAX_QUEUE', 1024)),
+)
+
+
+def _on_model_swapped(bundle):
+    # Cached decisions were produced by the previous model
+    decision_cache.clear()
+    if bundle.name == DEFAULT_MODEL_NAME:
+        # Marked on publish: the registry computes the model's pump boundaries only afterwards
+        _mark_startup("default_model_s")
+    if bundle.extended and WEB_CONCURRENCY > 1:
+        logger.warning(f"Model '{bundle.name}' uses rolling per-location features, but {WEB_CONCURRENCY} workers "
+                       "each keep their own history: unless requests are routed by locationId, its inputs "
+                       "differ from what it was trained on. Run it with WEB_CONCURRENCY=1.")
+
+registry.add_listener(_on_model_swapped)
+
+
+def _mark_startup(milestone: str):
+    startup_timings.setdefault(milestone, round(time.perf_counter() - _import_started, 4))
+
+
+def _start_worker_clock():
+    # Runs in every worker forked from the preloading master, which would otherwise report the
+    # master's import and load times as its own cold start
+    global _import_started
+    preload = dict(startup_timings)
+    startup_timings.clear()
+    startup_timings["preload"] = preload
+    _import_started = time.perf_counter()
 
-    if ml_model and scaler:
-        logger.info("--- Model and scaler are ready ---")
+
+def _log_startup_report(process: str = "worker"):
+    models = {name: round(registry.get(name).load_s or 0, 4) for name in registry.names()}
+    logger.info(f"--- Startup timings ({process} pid {os.getpid()}, mode {MODEL_LOAD_MODE}): {startup_timings}, "
+                f"model load seconds: {models} ---")
+
+
+def load_models(names: Optional[List[str]] = None):
+    global model_load_state
+    model_load_state = "loading"
+    logger.info(f"--- Starting model loading from {MODEL_DIR} ---")
+    results = registry.reload(names)
+    for name, result in results.items():
+        logger.info(f"Model '{name}': {result}")
+
+    if registry.get():
+        logger.info(f"--- Default model '{DEFAULT_MODEL_NAME}' is ready ---")
     else:
         logger.warning("--- ML Model or scaler not available. Using Rule Engine as fallback for pump. ---")
+    _mark_startup("models_s")
+    model_load_state = "loaded"
+
+
+def _load_models_in_background():
+    global model_load_state
+    # The default model goes first: a compiled artifact only needs numpy, so /decide switches to it
+    # before the remaining (possibly joblib/scikit-learn) models are unpickled.
+    try:
+        registry.reload([DEFAULT_MODEL_NAME])
+        if registry.get():
+            logger.info(f"--- Default model '{DEFAULT_MODEL_NAME}' is ready ---")
+        load_models([name for name in registry.discover() if name != DEFAULT_MODEL_NAME])
+    except Exception as e:
+        logger.exception(f"Background model loading failed: {e}")
+        model_load_state = "failed"
+    # Started only now, so the watcher does not load the same artifacts a second time
+    registry.start_watcher()
+    _log_startup_report()
+
+
+def preload_models():
+    # Called once in the gunicorn master (preload_app) before workers are forked. Workers inherit
+    # the loaded arrays copy-on-write; freezing the GC keeps collections from touching (and thereby
+    # copying) the pages of these long-lived objects in every worker.
+    _mark_startup("imports_s")
+    if MODEL_LOAD_MODE == "background":
+        # Threads do not survive the fork, so each worker loads its models after it starts serving
+        logger.info("--- MODEL_LOAD_MODE=background: models are loaded by the workers ---")
+    else:
+        load_models()
+        gc.freeze()
+        logger.info(f"--- Models preloaded in master process (pid {os.getpid()}) ---")
+    _log_startup_report("master (preload)")
+    os.register_at_fork(after_in_child=_start_worker_clock)
+
+
+async def load_model_on_startup():
+    global service_ready, model_load_state
+    _mark_startup("imports_s")
+    background = False
+    if registry.names():
+        logger.info(f"--- Using {len(registry.names())} preloaded model(s) in worker (pid {os.getpid()}) ---")
+    elif MODEL_LOAD_MODE == "background":
+        # Requests are answered by the rule engine until the models are in
+        model_load_state = "loading"
+        threading.Thread(target=_load_models_in_background, name="model-load", daemon=True).start()
+        background = True
+    else:
+        load_models()
+    inference.start()
+
+    if not background:
+        registry.start_watcher()
+        # Warm-up: one inference through the pool so the first real request pays no thread start-up
+        # or first-call overhead.
+        bundle = registry.get()
+        if bundle:
+            try:
+                await inference.run(bundle.predict, bundle.warmup_features())
+            except Exception as e:
+                logger.exception(f"Warm-up inference failed: {e}")
+    service_ready = True
+    _mark_startup("ready_s")
+    logger.info(f"--- Worker (pid {os.getpid()}) is ready to accept traffic ---")
+    if not background:
+        _log_startup_report()
+
+
+async def stop_background_workers():
+    global service_ready
+    service_ready = False
+    registry.stop_watcher()
+    inference.stop()
+    stop_logging()
+
+
+def _queue_full_error(err: Exception) -> HTTPException:
+    # Inference queue full, or the pool stopped (shutdown) while the request waited for it
+    logger.warning("Rejecting decision request: %s", err)
+    return HTTPException(status_code=503, detail=str(err), headers={"Retry-After": "1"})
+
+
+def _bundle_version(bundle) -> Optional[int]:
+    return bundle.version if bundle else None
+
+
+def _get_bundle(location_id: str, requested_model: Optional[str]):
+    model_name = registry.resolve(location_id, requested_model)
+    bundle = registry.get(model_name)
+    # While models are still loading in the background, a model that is not in yet gets the rules
+    if requested_model and bundle is None and model_load_state != "loading":
+        raise HTTPException(status_code=400, detail=f"Unknown model '{requested_model}'. Available: {registry.names()}")
+    return model_name, bundle
 
 
 app = FastAPI(
     title="Smart Garden AI Decision Service",
     description="API for making watering and fan decisions (ML optional).",
     version="0.4.0",
-    on_startup=[load_model_on_startup]
+    on_startup=[load_model_on_startup],
+    on_shutdown=[stop_background_workers]
 )
+app.add_middleware(RequestTimingMiddleware, endpoints={"/decide": "decide", "/decide/bin": "decide_bin",
+                                                            "/decide/batch": "decide_batch"})
+
+def _json_safe(value):
+    # NaN/Infinity have no strict-JSON form; they are echoed back as strings
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request: Request, exc: RequestValidationError):
+    # FastAPI's default 422 body, which would otherwise fail to render for a rejected NaN/Infinity input
+    return JSONResponse(status_code=422, content={"detail": _json_safe(jsonable_encoder(exc.errors()))})
+
+
+METRICS_REGISTRY.gauge("decision_cache_hits_total", "Decision cache hits.", lambda: decision_cache.hits, "counter")
+METRICS_REGISTRY.gauge("decision_cache_misses_total", "Decision cache misses.", lambda: decision_cache.misses, "counter")
+METRICS_REGISTRY.gauge("decision_cache_size", "Entries in the decision cache.", lambda: len(decision_cache))
+METRICS_REGISTRY.gauge("feature_store_locations", "Locations with recent readings in the feature store.",
+                       lambda: len(feature_store))
+METRICS_REGISTRY.gauge("decision_requests_coalesced_total",
+                       "Decision requests answered with the result of an identical request in flight.",
+                       lambda: singleflight.coalesced, "counter")
+METRICS_REGISTRY.gauge("decision_requests_in_flight", "Distinct decision computations in flight.",
+                       lambda: len(singleflight))
+METRICS_REGISTRY.gauge("check_scheduler_locations", "Locations waiting for their next scheduled check.",
+                       lambda: len(check_scheduler))
+METRICS_REGISTRY.gauge("inference_queue_depth", "Requests waiting for or running inference.",
+                       lambda: inference.queue_depth)
+METRICS_REGISTRY.gauge("ml_model_loaded", "1 if the default model is loaded.", lambda: 1 if registry.get() else 0)
 
 
 @app.get("/", tags=["Root"])
@@ -75,119 +314,427 @@ async def read_root():
 
 @app.get("/health", tags=["Health Check"])
 async def health_check():
-    model_status = "loaded" if ml_model and scaler else "not loaded (using rules for pump)"
-    logger.info("Health check endpoint called.")
-    return {"status": "run", "port": APP_PORT, "ml_model_status": model_status}
-
-
-@app.post("/decide", response_model=CombinedDecisionResponse, tags=["Decision Making"])
-async def decide_action(request: DecisionRequest):
-    context_id = request.locationId
-    logger.info(f"--- Received decision request for context: {context_id} ---")
-    logger.debug(f"Received sensor data: {request.sensorData}")
-    logger.debug(f"Received configuration: {request.configuration}")
-
-    pump_decision = DecisionResponse(action=ACTION_PUMP_OFF, duration=0, urgency=URGENCY_NORMAL)
-    fan_decision = DecisionResponse(action=ACTION_FAN_OFF, duration=0, urgency=URGENCY_NORMAL)
+    bundle = registry.get()
+    model_status = "loaded" if bundle else "not loaded (using rules for pump)"
+    logger.debug("Health check endpoint called.")
+    return {"status": "run", "port": APP_PORT, "ml_model_status": model_status,
+            "model_loading": {"mode": MODEL_LOAD_MODE, "state": model_load_state, "timings_s": startup_timings},
+            "ml_model_backend": bundle.backend if bundle else None,
+            "ml_model_version": bundle.version if bundle else None,
+            "models": registry.names(),
+            "decision_cache": decision_cache.stats(),
+            "feature_store": feature_store.stats(),
+            "next_check": {"enabled": NEXT_CHECK_HINTS, **next_check.stats()},
+            "check_scheduler": check_scheduler.stats(),
+            "coalescing": {"enabled": DECISION_COALESCING, **singleflight.stats()},
+            "logging": {**logging_stats(), "decisions": decision_log.stats()},
+            "inference": inference.stats()}
+
+
+@app.get("/ready", tags=["Health Check"])
+async def readiness_check():
+    # Unlike /health (process is up), /ready says whether this worker should receive traffic:
+    # startup warm-up has finished and, unless READY_REQUIRES_MODEL=0, the default model is loaded.
+    model_loaded = registry.get() is not None
+    if not service_ready or (READY_REQUIRES_MODEL and not model_loaded):
+        return JSONResponse(status_code=503, content={"status": "not ready", "warmed_up": service_ready,
+                                                      "ml_model_loaded": model_loaded})
+    return {"status": "ready", "ml_model_loaded": model_loaded, "pid": os.getpid()}
+
+
+def _mark_validation_done(http_request: Request, endpoint: str) -> float:
+    # Time from the request entering the service until the handler runs: body read, JSON parsing
+    # and pydantic validation of the payload.
+    now = time.perf_counter()
+    started = http_request.scope.get("state", {}).get("request_started")
+    if started is not None:
+        STAGE_SECONDS.observe(now - started, endpoint, "validation")
+    return now
+
+
+def _mark_handler_finished(http_request: Request):
+    http_request.scope.setdefault("state", {})["handler_finished"] = time.perf_counter()
+
+
+def _record_decision(decision: Decision, pump_source: str, fan_source: str):
+    DECISIONS_TOTAL.inc("pump", decision[0], decision[2], pump_source)
+    DECISIONS_TOTAL.inc("fan", decision[3], decision[5], fan_source)
+
+
+def _record_pump(location_id: str, decision: Decision):
+    # "Time since last pump" is based on the pump decisions this service has handed out
+    if decision[0] == ACTION_PUMP_ON:
+        feature_store.record_pump(location_id)
+
+
+def _finish_decision(endpoint: str, reading: DecisionInput, decision: Decision, pump_source: str, fan_source: str,
+                     model_name: str, bundle, moisture_slope: float) -> DecisionResult:
+    # Bookkeeping shared by all decide endpoints, for fresh and cached decisions alike
+    _record_decision(decision, pump_source, fan_source)
+    _record_pump(reading.locationId, decision)
+    next_check_s = None
+    if NEXT_CHECK_HINTS:
+        try:
+            next_check_s = next_check.estimate(reading, decision, moisture_slope, bundle)
+            check_scheduler.schedule(reading.locationId, next_check_s)
+        except Exception as e:
+            logger.warning("Could not estimate next check for context %s: %s", reading.locationId, e)
+    result = decision + (next_check_s,)
+    decision_log.log(endpoint, reading, result, pump_source, fan_source, model_name if bundle else None)
+    return result
+
+
+async def _decide(reading: DecisionInput, endpoint: str, stage_started: float) -> DecisionResult:
+    # Decision core shared by the JSON and binary endpoints. It works on the flat request record
+    # and returns a plain tuple; each endpoint encodes the result itself. What was decided and why
+    # is logged once at the end (_finish_decision), not per branch.
+    context_id = reading.locationId
+    model_name, bundle = _get_bundle(context_id, reading.modelName)
+    # Extended models depend on the history as well as the payload, so their decisions are not cached
+    use_cache = not (bundle and bundle.extended)
+    # The model version is part of the key: a decision computed by a model that was swapped out
+    # while it ran must not be served after the swap cleared the cache.
+    cache_key = (decision_cache.make_key(reading, reading, model_name, _bundle_version(bundle))
+                 if use_cache else None)
+    cached_decision = decision_cache.get(cache_key) if use_cache else None
+    # A model with a lookup table is answered by one array read, right here: no inference queue,
+    # thread hop or batching window (readings outside its grid still go to the pool)
+    lookup_prediction = None
+    if cached_decision is None and bundle and bundle.lookup is not None:
+        lookup_prediction = bundle.lookup.get((reading.soilMoisture, reading.temperature, reading.humidity))
+    if cached_decision is None and bundle and lookup_prediction is None and not is_urgent_pump(reading.soilMoisture):
+        # A request the inference queue will turn away is rejected before its reading enters the
+        # history, so retrying it does not add the reading twice. Nothing awaits between here and
+        # inference.predict(), so the capacity is still there when it is taken.
+        try:
+            inference.check_capacity()
+        except InferenceQueueFull as e:
+            raise _queue_full_error(e)
+    # Every reading goes into the location's history, including ones answered from the cache
+    features = feature_store.update(context_id, reading.soilMoisture, reading.temperature, reading.humidity)
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - stage_started, endpoint, "cache_lookup")
+    stage_started = now
+    if cached_decision is not None:
+        return _finish_decision(endpoint, reading, cached_decision, "cache", "cache", model_name, bundle,
+                                features[len(BASE_FEATURES)])
+    ml_failed = False
+
+    pump, pump_source = PUMP_OFF, "default"
+    fan, fan_source = FAN_OFF, "default"
 
     try:
-        urgent_decision_result = check_urgent_conditions(
-            request.sensorData, request.configuration)
-
-        urgent_pump = None
-        urgent_fan = None
-        if urgent_decision_result:
-            logger.info(f"Urgent condition detected: {urgent_decision_result}")
-            if urgent_decision_result.action == ACTION_PUMP_ON:
-                urgent_pump = urgent_decision_result
-            elif urgent_decision_result.action == ACTION_FAN_ON:
-                urgent_fan = urgent_decision_result
+        urgent_pump = is_urgent_pump(reading.soilMoisture)
+        urgent_fan = not urgent_pump and is_urgent_fan(reading.temperature, reading.humidity)
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - stage_started, endpoint, "urgent_check")
+        stage_started = now
 
         # --- Determine PUMP action ---
         if urgent_pump:
-            pump_decision = urgent_pump
-            logger.info(f"==> PUMP decision (URGENT): {pump_decision}")
+            pump, pump_source = PUMP_URGENT, "urgent"
         else:
-            logger.info("No urgent pump condition, checking normal...")
             pump_decided_by_ml = False
-            if ml_model and scaler:
-                logger.info("Attempting pump prediction with ML model...")
+            if bundle:
                 try:
-                    sensor_dict = request.sensorData.model_dump()
-                    soil_moisture = sensor_dict['soilMoisture']
-                    temperature = sensor_dict['temperature']
-                    humidity = sensor_dict['humidity']
-
-                    soil_moisture_processed = soil_moisture
-                    features_array = np.array(
-                        [[soil_moisture_processed, temperature, humidity]])
-                    features_scaled = scaler.transform(features_array)
-
-                    prediction = ml_model.predict(features_scaled)
-                    pump_action_ml = prediction[0]
-
+                    if lookup_prediction is not None:
+                        pump_action_ml = lookup_prediction
+                        now = time.perf_counter()
+                        STAGE_SECONDS.observe(now - stage_started, endpoint, "lookup")
+                    else:
+                        # Scaling + prediction run on the inference pool (timed there), batched with
+                        # concurrent requests; this stage is the time spent waiting for the result.
+                        pump_action_ml = await inference.predict(
+                            bundle, features if bundle.extended else features[:len(BASE_FEATURES)], endpoint)
+                        now = time.perf_counter()
+                        STAGE_SECONDS.observe(now - stage_started, endpoint, "inference_wait")
+                    stage_started = now
+
+                    pump_source = "ml"
                     if pump_action_ml == 1:
-                        logger.info(f"ML model predicts: PUMP ON")
-                        # Safely get pumpDuration from config, fallback to default
-                        pump_duration_config = getattr(request.configuration, 'pumpDuration', DEFAULT_PUMP_DURATION_S)
-                        pump_decision = DecisionResponse(
-                            action=ACTION_PUMP_ON,
-                            duration=pump_duration_config,
-                            urgency=URGENCY_NORMAL
-                        )
+                        pump = (ACTION_PUMP_ON, reading.pumpDuration, URGENCY_NORMAL)
                         pump_decided_by_ml = True
-                    else:
-                        logger.info(f"ML model predicts: PUMP OFF. Will check rules if necessary.")
 
+                except (InferenceQueueFull, InferenceStopped):
+                    raise
                 except Exception as ml_err:
-                    logger.error(
-                        f"Error during ML pump prediction: {ml_err}. Falling back to rule engine.")
+                    ml_failed = True
+                    ML_FAILURES_TOTAL.inc(bundle.name)
+                    ML_FALLBACKS_TOTAL.inc("error")
+                    logger.error("Error during ML pump prediction: %s. Falling back to rule engine.", ml_err)
+                    stage_started = time.perf_counter()
 
             if not pump_decided_by_ml:
-                if not (ml_model and scaler):
-                     logger.warning("ML Model not available. Using rule engine for pump.")
-                logger.info("Checking pump with Rule Engine...")
-                pump_rule_decision = make_normal_pump_decision_rules(
-                    request.sensorData, request.configuration)
-                if pump_rule_decision.action == ACTION_PUMP_ON:
-                    logger.info(f"==> PUMP decision (Rule): {pump_rule_decision}")
-                    pump_decision = pump_rule_decision
-                else:
-                    logger.info(f"Pump decision (Rule): PUMP OFF")
-
+                if not bundle:
+                    ML_FALLBACKS_TOTAL.inc("unavailable")
+                if needs_pump(reading.soilMoisture, reading.temperature, reading.moistureThreshold, reading.tempMax):
+                    pump, pump_source = (ACTION_PUMP_ON, reading.pumpDuration, URGENCY_NORMAL), "rule"
+                now = time.perf_counter()
+                STAGE_SECONDS.observe(now - stage_started, endpoint, "rule_fallback")
+                stage_started = now
 
         # --- Determine FAN action ---
         if urgent_fan:
-            fan_decision = urgent_fan
-            logger.info(f"==> FAN decision (URGENT): {fan_decision}")
+            fan, fan_source = FAN_URGENT, "urgent"
+        elif needs_fan(reading.temperature, reading.humidity, reading.tempMax, reading.humidityMax):
+            fan, fan_source = (ACTION_FAN_ON, reading.fanDuration, URGENCY_NORMAL), "rule"
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - stage_started, endpoint, "fan_rules")
+
+        decision = pump + fan
+        if use_cache and not ml_failed:
+            decision_cache.put(cache_key, decision)
+        return _finish_decision(endpoint, reading, decision, pump_source, fan_source, model_name, bundle,
+                                features[len(BASE_FEATURES)])
+
+    except (InferenceQueueFull, InferenceStopped) as e:
+        raise _queue_full_error(e)
+    except Exception as e:
+        logger.exception("!!! Critical error processing decision for context %s: %s", context_id, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error processing decision for context {context_id}: {str(e)}"
+        )
+
+
+async def _decide_coalesced(reading: DecisionInput, endpoint: str, stage_started: float) -> DecisionResult:
+    if not DECISION_COALESCING:
+        return await _decide(reading, endpoint, stage_started)
+    return await singleflight.do(reading.astuple(), lambda: _decide(reading, endpoint, stage_started))
+
+
+@app.post("/decide", response_model=CombinedDecisionResponse, tags=["Decision Making"])
+async def decide_action(request: DecisionRequest, http_request: Request):
+    # The body is still validated by pydantic; the response is encoded directly, which skips
+    # FastAPI's response_model validation and JSON encoding.
+    stage_started = _mark_validation_done(http_request, "decide")
+    result = await _decide_coalesced(DecisionInput.from_request(request), "decide", stage_started)
+    _mark_handler_finished(http_request)
+    return Response(encode_json(result), media_type="application/json")
+
+
+@app.post("/decide/bin", tags=["Decision Making"], response_class=Response,
+          responses={200: {"content": {BINARY_MEDIA_TYPE: {}},
+                           "description": "16-byte decision, layout in decision_core.py"}})
+async def decide_binary(http_request: Request):
+    # Same decision as /decide with a fixed binary layout (see decision_core.py) in both directions
+    content_type = http_request.headers.get("content-type", "")
+    if content_type.split(";")[0].strip() != BINARY_MEDIA_TYPE:
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type {BINARY_MEDIA_TYPE}")
+    try:
+        reading = decode_request(await http_request.body())
+    except BinaryDecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    stage_started = _mark_validation_done(http_request, "decide_bin")
+    result = await _decide_coalesced(reading, "decide_bin", stage_started)
+    _mark_handler_finished(http_request)
+    return Response(encode_binary(result), media_type=BINARY_MEDIA_TYPE)
+
+
+def _decide_batch(readings: List[DecisionInput], bundles: list,
+                  features: np.ndarray) -> Tuple[List[Decision], List[Tuple[str, str]], bool]:
+    # `features` holds one feature-store row (base + rolling features) per request
+    n = len(readings)
+    if n == 0:
+        return [], [], False
+
+    stage_started = time.perf_counter()
+    sensors = features[:, :len(BASE_FEATURES)]
+    configs = np.array([(r.moistureThreshold, r.tempMax, r.humidityMax) for r in readings], dtype=float)
+    soil_moisture, temperature, humidity = sensors.T
+    moisture_threshold, temp_max, humidity_max = configs.T
+
+    urgent_pump, urgent_fan = check_urgent_conditions_batch(soil_moisture, temperature, humidity)
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - stage_started, "decide_batch", "urgent_check")
+    stage_started = now
+
+    # --- Determine PUMP action: one model call for every non-urgent row ---
+    candidates = ~urgent_pump
+    ml_pump = np.zeros(n, dtype=bool)
+    ml_decided = np.zeros(n, dtype=bool)
+    ml_failed = False
+    # Rows are grouped by model, so a batch that uses a single model makes a single call
+    groups = {}
+    for i, bundle in enumerate(bundles):
+        if bundle is not None and candidates[i]:
+            groups.setdefault(id(bundle), (bundle, []))[1].append(i)
+    for bundle, rows in groups.values():
+        try:
+            if bundle.lookup is not None:
+                ml_pump[rows] = bundle.predict(sensors[rows]) == 1
+                ml_decided[rows] = True
+                now = time.perf_counter()
+                STAGE_SECONDS.observe(now - stage_started, "decide_batch", "lookup")
+                stage_started = now
+                continue
+            features_scaled = bundle.transform(features[rows] if bundle.extended else sensors[rows])
+            now = time.perf_counter()
+            STAGE_SECONDS.observe(now - stage_started, "decide_batch", "scaling")
+            stage_started = now
+            ml_pump[rows] = bundle.predict_scaled(features_scaled) == 1
+            ml_decided[rows] = True
+            now = time.perf_counter()
+            STAGE_SECONDS.observe(now - stage_started, "decide_batch", "prediction")
+            stage_started = now
+        except Exception as ml_err:
+            ml_failed = True
+            ML_FAILURES_TOTAL.inc(bundle.name)
+            ML_FALLBACKS_TOTAL.inc("error", amount=len(rows))
+            logger.error("Error during batch ML pump prediction with '%s': %s. Falling back to rule engine.",
+                         bundle.name, ml_err)
+            stage_started = time.perf_counter()
+    unavailable = int((candidates & np.array([b is None for b in bundles])).sum())
+    if unavailable:
+        ML_FALLBACKS_TOTAL.inc("unavailable", amount=unavailable)
+    rule_pump = candidates & ~ml_pump & make_normal_pump_decision_rules_batch(
+        soil_moisture, temperature, moisture_threshold, temp_max)
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - stage_started, "decide_batch", "rule_fallback")
+    stage_started = now
+
+    # --- Determine FAN action ---
+    rule_fan = ~urgent_fan & check_normal_fan_conditions_batch(temperature, humidity, temp_max, humidity_max)
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - stage_started, "decide_batch", "fan_rules")
+
+    # --- Create combined decisions, in request order ---
+    decisions, sources = [], []
+    for r, is_urgent_pump_row, is_ml_pump, is_rule_pump, is_ml_decided, is_urgent_fan_row, is_rule_fan in zip(
+            readings, urgent_pump.tolist(), ml_pump.tolist(), rule_pump.tolist(), ml_decided.tolist(),
+            urgent_fan.tolist(), rule_fan.tolist()):
+        if is_urgent_pump_row:
+            pump, pump_source = PUMP_URGENT, "urgent"
+        elif is_ml_pump or is_rule_pump:
+            pump = (ACTION_PUMP_ON, r.pumpDuration, URGENCY_NORMAL)
+            pump_source = "ml" if is_ml_pump else "rule"
         else:
-            logger.info("No urgent fan condition, checking normal with Rule Engine...")
-            fan_rule_decision = check_normal_fan_conditions(
-                request.sensorData, request.configuration)
-            if fan_rule_decision:
-                logger.info(f"==> FAN decision (Rule): {fan_rule_decision}")
-                fan_decision = fan_rule_decision
-            else:
-                logger.info(f"Fan decision (Rule): FAN OFF")
+            pump, pump_source = PUMP_OFF, "ml" if is_ml_decided else "default"
 
+        if is_urgent_fan_row:
+            fan, fan_source = FAN_URGENT, "urgent"
+        elif is_rule_fan:
+            fan, fan_source = (ACTION_FAN_ON, r.fanDuration, URGENCY_NORMAL), "rule"
+        else:
+            fan, fan_source = FAN_OFF, "default"
 
-        # --- Create combined response ---
-        final_response = CombinedDecisionResponse(
-            pump_action=pump_decision.action,
-            pump_duration=pump_decision.duration,
-            pump_urgency=pump_decision.urgency,
-            fan_action=fan_decision.action,
-            fan_duration=fan_decision.duration,
-            fan_urgency=fan_decision.urgency,
-        )
+        decisions.append(pump + fan)
+        sources.append((pump_source, fan_source))
+
+    logger.debug("Batch decision: %d requests, %d urgent pump, %d urgent fan, %d ML pump, %d rule pump",
+                 n, urgent_pump.sum(), urgent_fan.sum(), ml_pump.sum(), rule_pump.sum())
+    return decisions, sources, ml_failed
 
-        logger.info(f"==> FINAL decision for context {context_id}: {final_response}")
-        return final_response
 
+def _answers_inline(readings: List[DecisionInput], bundles: list) -> bool:
+    # True when every row is decided by the rules or from a lookup table that covers it: the batch
+    # is then a few vectorized array reads, cheaper than the inference pool's queue and thread hop.
+    groups = {}
+    for r, bundle in zip(readings, bundles):
+        if bundle is not None:
+            groups.setdefault(id(bundle), (bundle, []))[1].append((r.soilMoisture, r.temperature, r.humidity))
+    return all(bundle.lookup is not None and bundle.lookup.covers(rows) for bundle, rows in groups.values())
+
+
+@app.post("/decide/batch", response_model=List[CombinedDecisionResponse], tags=["Decision Making"])
+async def decide_batch(requests: List[DecisionRequest], http_request: Request):
+    stage_started = _mark_validation_done(http_request, "decide_batch")
+    readings = [DecisionInput.from_request(r) for r in requests]
+    resolved = [_get_bundle(r.locationId, r.modelName) for r in readings]
+    try:
+        responses: List[Optional[Decision]] = [None] * len(readings)
+        sources = [("cache", "cache")] * len(readings)
+        keys = [decision_cache.make_key(r, r, model_name, _bundle_version(bundle))
+                if not (bundle and bundle.extended) else None
+                for r, (model_name, bundle) in zip(readings, resolved)]
+        missing = []
+        for i, key in enumerate(keys):
+            responses[i] = decision_cache.get(key) if key is not None else None
+            if responses[i] is None:
+                missing.append(i)
+
+        computed, computed_sources, ml_failed = [], [], False
+        missing_readings, missing_bundles = [readings[i] for i in missing], [resolved[i][1] for i in missing]
+        inline = _answers_inline(missing_readings, missing_bundles)
+        # Queue capacity for the rows to compute is taken before the feature store is touched: a
+        # rejected batch leaves no trace in the history, so its retry is not counted twice.
+        with inference.reserve(0 if inline else len(missing)):
+            # Readings are added in request order, so several readings for one location form its history
+            features = np.array([feature_store.update(r.locationId, r.soilMoisture, r.temperature, r.humidity)
+                                 for r in readings], dtype=float)
+            STAGE_SECONDS.observe(time.perf_counter() - stage_started, "decide_batch", "cache_lookup")
+            if inline:
+                computed, computed_sources, ml_failed = _decide_batch(missing_readings, missing_bundles,
+                                                                      features[missing])
+            else:
+                computed, computed_sources, ml_failed = await inference.execute(
+                    _decide_batch, missing_readings, missing_bundles, features[missing])
+        for i, response, source in zip(missing, computed, computed_sources):
+            responses[i] = response
+            sources[i] = source
+            if not ml_failed and keys[i] is not None:
+                decision_cache.put(keys[i], response)
+        results = [_finish_decision("decide_batch", r, response, pump_source, fan_source, model_name, bundle,
+                                    row[len(BASE_FEATURES)])
+                   for r, response, (pump_source, fan_source), (model_name, bundle), row
+                   in zip(readings, responses, sources, resolved, features.tolist())]
+        _mark_handler_finished(http_request)
+        return Response(encode_json_list(results), media_type="application/json")
+    except (InferenceQueueFull, InferenceStopped) as e:
+        raise _queue_full_error(e)
     except Exception as e:
-        logger.exception(
-            f"!!! Critical error processing decision for context {context_id}: {e}")
+        logger.exception("!!! Critical error processing batch decision: %s", e)
         raise HTTPException(
             status_code=500,
-            detail=f"Internal server error processing decision for context {context_id}: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Internal server error processing batch decision: {str(e)}"
+        )
+
+
+@app.get("/schedule/due", tags=["Scheduling"])
+async def schedule_due(limit: int = 1000):
+    # Locations whose next-check hint has run out, most overdue first. They leave the queue here and
+    # come back with the hint of their next decision, so the caller should request one for each.
+    # Only this worker's locations are listed (see check_scheduler above).
+    due = check_scheduler.pop_due(limit=max(limit, 0))
+    next_due_in = check_scheduler.next_due_in()
+    return {"due": [{"locationId": location_id, "overdue_s": round(overdue_s, 3)} for location_id, overdue_s in due],
+            "scheduled": len(check_scheduler),
+            "next_due_in_s": round(next_due_in, 3) if next_due_in is not None else None}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health Check"])
+async def metrics():
+    return PlainTextResponse(METRICS_REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+# --- Model administration ---
+# Location assignments and reload requests are files in MODEL_DIR (see model_registry.py), so a
+# change sent to one worker reaches every worker within MODEL_WATCH_INTERVAL_S. With the watcher
+# off (MODEL_WATCH_INTERVAL_S=0) they only apply to the worker that answers: run a single worker.
+
+@app.get("/admin/models", tags=["Admin"])
+async def list_models():
+    return registry.status()
+
+
+@app.post("/admin/models/reload", status_code=202, tags=["Admin"])
+async def reload_models(name: Optional[str] = None):
+    names = [name] if name else None
+    registry.request_reload(names)
+    logger.info(f"Background reload requested for: {name or 'all models'}")
+    return {"status": "reloading", "models": names or registry.discover()}
+
+
+@app.put("/admin/models/locations/{location_id}", tags=["Admin"])
+async def assign_location_model(location_id: str, assignment: ModelAssignment):
+    if registry.get(assignment.modelName) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{assignment.modelName}'. Available: {registry.names()}")
+    registry.assign_location(location_id, assignment.modelName)
+    return {"locationId": location_id, "modelName": assignment.modelName}
+
+
+@app.delete("/admin/models/locations/{location_id}", tags=["Admin"])
+async def unassign_location_model(location_id: str):
+    if not registry.unassign_location(location_id):
+        raise HTTPException(status_code=404, detail=f"No model assigned to location '{location_id}'")
+    return {"locationId": location_id, "modelName": registry.default_model}
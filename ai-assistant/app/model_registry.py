@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .forest_engine import load_compiled_forest
+from .feature_store import BASE_FEATURES, features_without_history
+from .lookup_table import artifact_fingerprint, load_or_build
+from .next_check import PumpBoundaries
+
+logger = logging.getLogger(__name__)
+
+SHARED_SCALER_NAME = 'pump_scaler'
+# Admin state shared by all worker processes through the model directory: every worker's watcher
+# applies changes to these files, whichever worker wrote them.
+ASSIGNMENTS_FILE = 'location_models.json'
+RELOAD_REQUEST_FILE = 'reload_request.json'
+STATE_LOCK_FILE = '.registry.lock'
+
+# Soil moisture, temperature, humidity; a new model must answer these before it is swapped in.
+WARMUP_FEATURES = np.array([
+    [5.0, 25.0, 60.0],
+    [30.0, 28.0, 70.0],
+    [60.0, 32.0, 80.0],
+    [90.0, 20.0, 40.0],
+])
+
+
+class ModelBundle:
+    # A scaler and the model trained with it. Bundles are never mutated after loading (apart from
+    # `pump_boundaries`, attached once right after publishing); swapping a bundle reference is what
+    # makes a new (scaler, model) pair visible.
+    def __init__(self, name: str, version: int, scaler, model, backend: str, files: Dict[str, float]):
+        self.name = name
+        self.version = version
+        self.scaler = scaler
+        self.model = model
+        self.backend = backend
+        self.files = files
+        self.loaded_at = time.time()
+        self.load_s: Optional[float] = None
+        # Models trained with `--extended` also take the rolling features from the feature store
+        self.n_features = len(scaler.mean_)
+        # Optional precomputed grid of this model's predictions (set before the bundle is published)
+        self.lookup = None
+        # Soil moisture values where the pump prediction flips, for next-check hints (None until computed)
+        self.pump_boundaries: Optional[PumpBoundaries] = None
+
+    @property
+    def extended(self) -> bool:
+        return self.n_features > len(BASE_FEATURES)
+
+    def warmup_features(self) -> np.ndarray:
+        return features_without_history(WARMUP_FEATURES) if self.extended else WARMUP_FEATURES
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        return self.scaler.transform(features)
+
+    def predict_scaled(self, features_scaled: np.ndarray) -> np.ndarray:
+        return self.model.predict(features_scaled)
+
+    def predict_model(self, features: np.ndarray) -> np.ndarray:
+        return self.predict_scaled(self.transform(features))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        if self.lookup is not None:
+            return self.lookup.predict(features, self.predict_model)
+        return self.predict_model(features)
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "backend": self.backend,
+            "n_features": self.n_features,
+            "lookup": self.lookup.info() if self.lookup is not None else None,
+            "pump_boundaries": self.pump_boundaries.info() if self.pump_boundaries is not None else None,
+            "files": sorted(os.path.basename(path) for path in self.files),
+            "loaded_at": self.loaded_at,
+            "load_s": self.load_s,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, model_dir: str, default_model: str, watch_interval_s: float = 0, lookup_step: float = 0,
+                 lookup_dir: Optional[str] = None, pump_boundaries: bool = False):
+        self.model_dir = model_dir
+        self.default_model = default_model
+        self.watch_interval_s = watch_interval_s
+        # lookup_step > 0 answers base-feature models from a precomputed grid (see lookup_table.py)
+        self.lookup_step = lookup_step
+        self.lookup_dir = lookup_dir or model_dir
+        # Computes each base-feature model's pump boundaries while loading it (see next_check.py)
+        self.pump_boundaries = pump_boundaries
+        self._bundles: Dict[str, ModelBundle] = {}
+        self._location_models: Dict[str, str] = {}
+        # Identity (inode, mtime) of the assignments file last read, id of the last reload request seen
+        self._assignments_seen = None
+        self._reload_request_seen: Optional[str] = None
+        self._listeners: List[Callable[[ModelBundle], None]] = []
+        self._load_lock = threading.Lock()
+        self._next_version = 1
+        self._last_errors: Dict[str, str] = {}
+        self._failed_files: Dict[str, Dict[str, float]] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    # --- Lookup ---
+
+    def get(self, name: Optional[str] = None) -> Optional[ModelBundle]:
+        return self._bundles.get(name or self.default_model)
+
+    def resolve(self, location_id: Optional[str] = None, requested: Optional[str] = None) -> str:
+        if requested:
+            return requested
+        if location_id is not None:
+            return self._location_models.get(location_id, self.default_model)
+        return self.default_model
+
+    def names(self) -> List[str]:
+        return sorted(self._bundles)
+
+    def assign_location(self, location_id: str, name: str):
+        with self._state_lock():
+            assignments = self._read_assignments()
+            assignments[location_id] = name
+            self._write_assignments(assignments)
+
+    def unassign_location(self, location_id: str) -> bool:
+        with self._state_lock():
+            assignments = self._read_assignments()
+            if assignments.pop(location_id, None) is None:
+                self._location_models = assignments
+                return False
+            self._write_assignments(assignments)
+        return True
+
+    # --- Admin state shared between workers ---
+
+    def _state_path(self, file_name: str) -> str:
+        return os.path.join(self.model_dir, file_name)
+
+    @contextmanager
+    def _state_lock(self):
+        # Serializes read-modify-write of the shared files across worker processes
+        with open(self._state_path(STATE_LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_state(self, file_name: str, data):
+        # Written to a temporary file and renamed, so other workers never read a partial file
+        path = self._state_path(file_name)
+        with open(f"{path}.{os.getpid()}.tmp", 'w') as f:
+            json.dump(data, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _read_state(self, file_name: str):
+        try:
+            with open(self._state_path(file_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _file_identity(self, file_name: str):
+        try:
+            stat = os.stat(self._state_path(file_name))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_assignments(self) -> Dict[str, str]:
+        self._assignments_seen = self._file_identity(ASSIGNMENTS_FILE)
+        return dict(self._read_state(ASSIGNMENTS_FILE) or {})
+
+    def _write_assignments(self, assignments: Dict[str, str]):
+        self._write_state(ASSIGNMENTS_FILE, assignments)
+        self._assignments_seen = self._file_identity(ASSIGNMENTS_FILE)
+        self._location_models = assignments
+
+    def sync_assignments(self):
+        # Picks up assignments written by any worker; cheap (one stat) when nothing changed
+        if self._file_identity(ASSIGNMENTS_FILE) != self._assignments_seen:
+            self._location_models = self._read_assignments()
+
+    def request_reload(self, names: Optional[List[str]] = None) -> threading.Thread:
+        # Reloads here at once; the other workers' watchers see the request file and reload too
+        request_id = uuid.uuid4().hex
+        self._write_state(RELOAD_REQUEST_FILE, {"id": request_id, "names": names, "requested_at": time.time()})
+        self._reload_request_seen = request_id
+        return self.reload_in_background(names)
+
+    def _check_reload_request(self):
+        request = self._read_state(RELOAD_REQUEST_FILE)
+        if request and request.get("id") != self._reload_request_seen:
+            self._reload_request_seen = request.get("id")
+            logger.info(f"Reload requested by another worker for: {request.get('names') or 'all models'}")
+            self.reload(request.get("names"))
+
+    def add_listener(self, callback: Callable[[ModelBundle], None]):
+        self._listeners.append(callback)
+
+    # --- Loading ---
+
+    def discover(self) -> List[str]:
+        try:
+            files = os.listdir(self.model_dir)
+        except FileNotFoundError:
+            return []
+        names = set()
+        for file_name in files:
+            stem, ext = os.path.splitext(file_name)
+            if ext in ('.joblib', '.npz') and not stem.endswith('_scaler'):
+                names.add(stem)
+        return sorted(names)
+
+    def _artifact_files(self, name: str) -> Dict[str, float]:
+        # Compiled artifacts carry their own scaler; joblib models prefer `<name>_scaler.joblib`
+        # and fall back to the shared pump scaler.
+        compiled_path = os.path.join(self.model_dir, f'{name}.npz')
+        if os.path.exists(compiled_path):
+            paths = [compiled_path]
+        else:
+            model_path = os.path.join(self.model_dir, f'{name}.joblib')
+            scaler_path = os.path.join(self.model_dir, f'{name}_scaler.joblib')
+            if not os.path.exists(scaler_path):
+                scaler_path = os.path.join(self.model_dir, f'{SHARED_SCALER_NAME}.joblib')
+            paths = [model_path, scaler_path]
+        return {path: os.path.getmtime(path) if os.path.exists(path) else None for path in paths}
+
+    def _load_bundle(self, name: str, files: Dict[str, float]) -> ModelBundle:
+        missing = [path for path, mtime in files.items() if mtime is None]
+        if missing:
+            raise FileNotFoundError(f"Missing artifact(s) for model '{name}': {missing}")
+
+        started = time.perf_counter()
+        paths = list(files)
+        if paths[0].endswith('.npz'):
+            scaler, model = load_compiled_forest(paths[0])
+            backend = "compiled"
+        else:
+            # Imported here: unpickling pulls in scikit-learn, which compiled artifacts never need
+            import joblib
+            model = joblib.load(paths[0])
+            scaler = joblib.load(paths[1])
+            backend = "joblib"
+
+        version = self._next_version
+        self._next_version += 1
+        bundle = ModelBundle(name, version, scaler, model, backend, files)
+        self._warm_up(bundle)
+        if self.lookup_step > 0 and not bundle.extended:
+            bundle.lookup = load_or_build(self.lookup_path(name), bundle.predict_model, self.lookup_step,
+                                          fingerprint=artifact_fingerprint(files))
+        bundle.load_s = time.perf_counter() - started
+        return bundle
+
+    def lookup_path(self, name: str) -> str:
+        return os.path.join(self.lookup_dir, f'{name}_lut.npy')
+
+    def _warm_up(self, bundle: ModelBundle):
+        predictions = np.asarray(bundle.predict(bundle.warmup_features()))
+        if predictions.shape != (len(WARMUP_FEATURES),):
+            raise ValueError(f"Warm-up returned shape {predictions.shape}, expected ({len(WARMUP_FEATURES)},)")
+        if not np.isin(predictions, [0, 1]).all():
+            raise ValueError(f"Warm-up returned unexpected classes: {np.unique(predictions)}")
+
+    def reload(self, names: Optional[List[str]] = None) -> Dict[str, str]:
+        results = {}
+        published = []
+        with self._load_lock:
+            for name in names or self.discover():
+                files = self._artifact_files(name)
+                try:
+                    bundle = self._load_bundle(name, files)
+                except Exception as e:
+                    logger.exception(f"Failed to load model '{name}', keeping previous version: {e}")
+                    self._last_errors[name] = str(e)
+                    self._failed_files[name] = files
+                    results[name] = f"error: {e}"
+                    continue
+                self._bundles = {**self._bundles, name: bundle}
+                self._last_errors.pop(name, None)
+                self._failed_files.pop(name, None)
+                results[name] = f"loaded v{bundle.version} ({bundle.backend})"
+                logger.info(f"Model '{name}' v{bundle.version} ({bundle.backend}) is now active.")
+                for callback in self._listeners:
+                    callback(bundle)
+                published.append(bundle)
+            # Computed once the models already serve, as this takes seconds for a large forest;
+            # hints use the rule thresholds until then.
+            for bundle in published:
+                if self.pump_boundaries and not bundle.extended:
+                    try:
+                        bundle.pump_boundaries = PumpBoundaries.build(bundle.predict)
+                    except Exception as e:
+                        logger.exception(f"Could not compute pump boundaries for model '{bundle.name}': {e}")
+        return results
+
+    def reload_in_background(self, names: Optional[List[str]] = None) -> threading.Thread:
+        thread = threading.Thread(target=self.reload, args=(names,), name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    # --- Directory watcher ---
+
+    def start_watcher(self):
+        # Assignments are read now; a reload request already on disk predates this process's models
+        self.sync_assignments()
+        request = self._read_state(RELOAD_REQUEST_FILE)
+        self._reload_request_seen = request.get("id") if request else None
+        if self.watch_interval_s <= 0 or self._watcher is not None:
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching {self.model_dir} for new models every {self.watch_interval_s}s.")
+
+    def stop_watcher(self):
+        if self._watcher is None:
+            return
+        self._stop_watching.set()
+        self._watcher.join(timeout=self.watch_interval_s + 1)
+        self._watcher = None
+
+    def _watch(self):
+        # A changed artifact is only reloaded once it looked the same on two consecutive polls,
+        # so a trainer that is still writing files is not picked up halfway.
+        pending: Dict[str, Dict[str, float]] = {}
+        while not self._stop_watching.wait(self.watch_interval_s):
+            try:
+                self.sync_assignments()
+                self._check_reload_request()
+                for name in self.discover():
+                    files = self._artifact_files(name)
+                    bundle = self._bundles.get(name)
+                    if (bundle is not None and bundle.files == files) or self._failed_files.get(name) == files:
+                        pending.pop(name, None)
+                        continue
+                    if pending.get(name) == files:
+                        pending.pop(name)
+                        self.reload([name])
+                    else:
+                        pending[name] = files
+            except Exception as e:
+                logger.exception(f"Model watcher error: {e}")
+
+    def status(self) -> dict:
+        self.sync_assignments()
+        return {
+            "default_model": self.default_model,
+            "models": {name: bundle.info() for name, bundle in self._bundles.items()},
+            "location_models": dict(self._location_models),
+            "errors": dict(self._last_errors),
+            "watch_interval_s": self.watch_interval_s,
+        }
@@ -1,21 +1,24 @@
 from pydantic import BaseModel, Field
 from typing import Optional
 
+# Readings and thresholds must be finite: NaN/Infinity are rejected with 422 (as on /decide/bin)
+# before they can reach the feature store or the decision cache.
 class SensorData(BaseModel):
-    soilMoisture: float = Field(...)
-    temperature: float = Field(...)
-    humidity: float = Field(...)
+    soilMoisture: float = Field(..., allow_inf_nan=False)
+    temperature: float = Field(..., allow_inf_nan=False)
+    humidity: float = Field(..., allow_inf_nan=False)
 
 class ConfigurationData(BaseModel):
-    moistureThreshold: float = Field(...)
-    tempMin: Optional[float] = Field(None)
-    tempMax: float = Field(...)
-    humidityMax: float = Field(...)
+    moistureThreshold: float = Field(..., allow_inf_nan=False)
+    tempMin: Optional[float] = Field(None, allow_inf_nan=False)
+    tempMax: float = Field(..., allow_inf_nan=False)
+    humidityMax: float = Field(..., allow_inf_nan=False)
 
 class DecisionRequest(BaseModel):
     locationId: str = Field(...)
     sensorData: SensorData = Field(...)
     configuration: ConfigurationData = Field(...)
+    modelName: Optional[str] = Field(None)
 
 class DecisionResponse(BaseModel):
     action: str = Field(...)
@@ -28,4 +31,9 @@ class CombinedDecisionResponse(BaseModel):
     pump_urgency: str = Field(...)
     fan_action: str = Field(...)
     fan_duration: int = Field(...)
-    fan_urgency: str = Field(...)
\ No newline at end of file
+    fan_urgency: str = Field(...)
+    # Seconds until the decision could plausibly change; poll this location again after that long
+    next_check_s: Optional[int] = Field(None)
+
+class ModelAssignment(BaseModel):
+    modelName: str = Field(...)
\ No newline at end of file
@@ -0,0 +1,159 @@
+import bisect
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .rule_engine import (
+    ACTION_PUMP_ON, ACTION_FAN_ON,
+    CRITICAL_SOIL_MOISTURE, CRITICAL_TEMPERATURE, CRITICAL_HUMIDITY, TEMP_SAFETY_MARGIN
+)
+
+# Hints are rounded down to one of these, so a hint never overstates the time left and clients see
+# a handful of distinct values.
+HINT_STEPS_S = (30, 60, 120, 300, 600, 900, 1800, 3600)
+
+# Slowest change per minute assumed for each reading when the recent trend is flat or points away
+# from a threshold; a reading can always turn around.
+MIN_SOIL_MOISTURE_RATE = 0.2
+TEMPERATURE_RATE = 0.25
+HUMIDITY_RATE = 1.0
+
+# Soil moisture values at which a model is probed to find where its pump prediction flips: a coarse
+# pass over the whole range, then every interval with a flip again at the fine step. (A flip and
+# flip back within one coarse step goes unnoticed.)
+SOIL_MOISTURE_PROBES = np.arange(0.0, 100.5, 5.0)
+SOIL_MOISTURE_REFINE_STEP = 1.0
+# Whole-degree temperatures and whole-percent humidities the boundaries are computed for (as the
+# lookup table grid); readings outside use the nearest cell.
+BOUNDARY_TEMPERATURE_RANGE = (-10, 60)
+BOUNDARY_HUMIDITY_RANGE = (0, 100)
+# Rows per predict call while building (as LookupTable.build evaluates its grid in chunks): a forest
+# holds several KB per row during a call, so the ~150k probe rows at once would cost hundreds of MB.
+BOUNDARY_CHUNK_ROWS = 8192
+
+
+def round_hint(seconds: float, min_s: float = HINT_STEPS_S[0], max_s: float = HINT_STEPS_S[-1]) -> int:
+    seconds = min(max(seconds, min_s), max_s)
+    index = bisect.bisect_right(HINT_STEPS_S, seconds) - 1
+    return HINT_STEPS_S[max(index, 0)]
+
+
+def _minutes_to_nearest(value: float, thresholds: Sequence[float], rate_up: float, rate_down: float) -> float:
+    # Minutes until `value` reaches the closest threshold, rising or falling at the given rates
+    minutes = float('inf')
+    for threshold in thresholds:
+        if threshold >= value:
+            minutes = min(minutes, (threshold - value) / rate_up)
+        else:
+            minutes = min(minutes, (value - threshold) / rate_down)
+    return minutes
+
+
+class PumpBoundaries:
+    # Soil moisture values where a model's pump prediction flips, for every whole temperature and
+    # humidity in range. Built once when the model is loaded (off the event loop), so estimating a
+    # hint is a lookup.
+    def __init__(self, cells: List[Tuple[float, ...]], temperature_range: Tuple[int, int],
+                 humidity_range: Tuple[int, int], build_s: Optional[float] = None):
+        self.cells = cells
+        self.temperature_range = temperature_range
+        self.humidity_range = humidity_range
+        self.build_s = build_s
+
+    @classmethod
+    def build(cls, predict: Callable[[np.ndarray], np.ndarray], temperature_range=BOUNDARY_TEMPERATURE_RANGE,
+              humidity_range=BOUNDARY_HUMIDITY_RANGE, chunk_rows: int = BOUNDARY_CHUNK_ROWS) -> "PumpBoundaries":
+        started = time.perf_counter()
+        temperatures = np.arange(temperature_range[0], temperature_range[1] + 1, dtype=float)
+        humidities = np.arange(humidity_range[0], humidity_range[1] + 1, dtype=float)
+        # Cell i is temperature i // len(humidities), humidity i % len(humidities)
+        conditions = np.column_stack([np.repeat(temperatures, len(humidities)), np.tile(humidities, len(temperatures))])
+        probes = SOIL_MOISTURE_PROBES
+        # At most `chunk_rows` rows per predict call, so memory stays bounded however many cells there are
+        per_chunk = max(1, chunk_rows // len(probes))
+        coarse = np.concatenate([_predict_grid(predict, probes, conditions[start:start + per_chunk])
+                                 for start in range(0, len(conditions), per_chunk)])
+
+        # Every coarse interval with a flip, probed again in between at the fine step; the boundary
+        # is the midpoint between the last probe before the flip and the first one after it
+        cells: List[list] = [[] for _ in range(len(conditions))]
+        cell, interval = np.nonzero(coarse[:, 1:] != coarse[:, :-1])
+        if len(cell):
+            fine_offsets = np.arange(SOIL_MOISTURE_REFINE_STEP, probes[1] - probes[0], SOIL_MOISTURE_REFINE_STEP)
+            fine_soil = probes[interval][:, None] + fine_offsets
+            per_chunk = max(1, chunk_rows // len(fine_offsets))
+            fine = np.concatenate([
+                np.asarray(predict(np.column_stack([
+                    fine_soil[start:start + per_chunk].ravel(),
+                    np.repeat(conditions[cell[start:start + per_chunk]], len(fine_offsets), axis=0)
+                ]))).reshape(-1, len(fine_offsets))
+                for start in range(0, len(cell), per_chunk)])
+            before, after = coarse[cell, interval], coarse[cell, interval + 1]
+            soil = np.column_stack([probes[interval], fine_soil, probes[interval + 1]])
+            j = np.argmax(np.column_stack([fine, after]) != before[:, None], axis=1) + 1
+            rows = np.arange(len(cell))
+            for i, boundary in zip(cell.tolist(), ((soil[rows, j - 1] + soil[rows, j]) / 2).tolist()):
+                cells[i].append(boundary)
+        return cls([tuple(boundaries) for boundaries in cells], tuple(temperature_range), tuple(humidity_range),
+                   time.perf_counter() - started)
+
+    def at(self, temperature: float, humidity: float) -> Tuple[float, ...]:
+        t = min(max(round(temperature), self.temperature_range[0]), self.temperature_range[1])
+        h = min(max(round(humidity), self.humidity_range[0]), self.humidity_range[1])
+        width = self.humidity_range[1] - self.humidity_range[0] + 1
+        return self.cells[(t - self.temperature_range[0]) * width + (h - self.humidity_range[0])]
+
+    def info(self) -> dict:
+        return {"cells": len(self.cells), "boundaries": sum(map(len, self.cells)),
+                "build_s": round(self.build_s, 4) if self.build_s is not None else None}
+
+
+def _predict_grid(predict: Callable[[np.ndarray], np.ndarray], soil_moisture: np.ndarray,
+                  conditions: np.ndarray) -> np.ndarray:
+    # Predictions for every (temperature, humidity) row of `conditions` at every soil moisture value
+    X = np.column_stack([np.tile(soil_moisture, len(conditions)), np.repeat(conditions, len(soil_moisture), axis=0)])
+    return np.asarray(predict(X)).reshape(len(conditions), len(soil_moisture))
+
+
+class NextCheckEstimator:
+    # Estimates how long the current decision for a location will hold: the time until one of its
+    # readings can reach a rule threshold or the model's pump boundary, at the recent soil moisture
+    # trend (from the feature store) or the assumed minimum rates, whichever is faster.
+    def __init__(self, min_s: float = HINT_STEPS_S[0], max_s: float = HINT_STEPS_S[-1]):
+        self.min_s = min_s
+        self.max_s = max_s
+
+    def estimate(self, reading, decision, moisture_slope: float = 0.0, bundle=None) -> int:
+        # `reading` is a DecisionInput, `decision` the tuple returned for it, `bundle` the model that
+        # decides the pump (None: the rules do).
+        active = [duration for action, duration in ((decision[0], decision[1]), (decision[3], decision[4]))
+                  if action in (ACTION_PUMP_ON, ACTION_FAN_ON)]
+        if active:
+            # A running actuator changes the readings itself; look again once the shortest one stops
+            return round_hint(min(active), self.min_s, self.max_s)
+
+        soil_thresholds = [CRITICAL_SOIL_MOISTURE]
+        temperature_thresholds = [CRITICAL_TEMPERATURE, reading.tempMax]
+        boundaries = getattr(bundle, 'pump_boundaries', None)
+        if boundaries is not None:
+            soil_thresholds += boundaries.at(reading.temperature, reading.humidity)
+        else:
+            # Rule-based pump. Extended models depend on history too and get no precomputed
+            # boundaries, so the rules stand in for them.
+            soil_thresholds.append(reading.moistureThreshold)
+            temperature_thresholds.append(reading.tempMax - TEMP_SAFETY_MARGIN)
+
+        minutes = min(
+            _minutes_to_nearest(reading.soilMoisture, soil_thresholds,
+                                max(MIN_SOIL_MOISTURE_RATE, moisture_slope), max(MIN_SOIL_MOISTURE_RATE, -moisture_slope)),
+            _minutes_to_nearest(reading.temperature, temperature_thresholds, TEMPERATURE_RATE, TEMPERATURE_RATE),
+            _minutes_to_nearest(reading.humidity, (CRITICAL_HUMIDITY, reading.humidityMax), HUMIDITY_RATE, HUMIDITY_RATE),
+        )
+        return round_hint(minutes * 60.0, self.min_s, self.max_s)
+
+    def stats(self) -> dict:
+        return {
+            "min_s": self.min_s,
+            "max_s": self.max_s,
+        }
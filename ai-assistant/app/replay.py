@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import logging
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .rule_engine import (
+    check_urgent_conditions_batch,
+    check_normal_fan_conditions_batch,
+    make_normal_pump_decision_rules_batch,
+    CRITICAL_SOIL_MOISTURE, CRITICAL_TEMPERATURE, CRITICAL_HUMIDITY,
+    URGENT_PUMP_DURATION_S, URGENT_FAN_DURATION_S, DEFAULT_PUMP_DURATION_S, DEFAULT_FAN_DURATION_S
+)
+from .model_registry import ModelRegistry
+from .dataset_cache import DatasetCache, HISTORY_FORMATS, detect_format
+
+logger = logging.getLogger(__name__)
+
+# Replays the /decide pipeline (urgent rules -> ML -> pump rules, fan rules) over recorded sensor
+# history, e.g.: python -m app.replay --data data/data.csv --moisture-threshold 20 30 40 --jobs 4
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(SCRIPT_DIR, '..', 'models_trained')
+DEFAULT_CHUNK_SIZE = 100_000
+# Seconds between consecutive readings of a location (sensors report once a minute). A pump or fan
+# run is counted up to this long, as the next reading's decision takes over; 0 counts full runs.
+DEFAULT_INTERVAL_S = 60
+
+DEFAULT_PARAMETERS = {
+    'critical_soil_moisture': CRITICAL_SOIL_MOISTURE,
+    'critical_temperature': CRITICAL_TEMPERATURE,
+    'critical_humidity': CRITICAL_HUMIDITY,
+    'moisture_threshold': 30.0,
+    'temp_max': 35.0,
+    'humidity_max': 80.0,
+    'pump_duration_s': DEFAULT_PUMP_DURATION_S,
+    'fan_duration_s': DEFAULT_FAN_DURATION_S,
+}
+
+COUNT_NAMES = ('readings', 'pump_urgent', 'pump_ml', 'pump_rule', 'pump_off', 'ml_evaluated',
+               'fan_urgent', 'fan_rule', 'fan_off', 'pump_seconds', 'fan_seconds')
+
+
+def iter_sensor_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       history_format: Optional[str] = None) -> Iterator[np.ndarray]:
+    # Yields (n, 3) arrays of soil moisture, temperature, humidity in service units; only one
+    # chunk is held in memory at a time.
+    columns, divisor, _ = HISTORY_FORMATS[history_format or detect_format(path)]
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+        sensors = chunk[columns].to_numpy(dtype=np.float64)
+        sensors = sensors[np.isfinite(sensors).all(axis=1)]
+        sensors[:, 0] /= divisor
+        if len(sensors):
+            yield sensors
+
+
+def iter_cached_sensor_chunks(cache: DatasetCache, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    # Same chunks from the memory-mapped dataset cache (already cleaned and rescaled)
+    for start, stop in cache.iter_ranges(chunk_size):
+        yield cache.sensors(start, stop)
+
+
+def replay_chunk(sensors: np.ndarray, params: Dict[str, float], ml_pump: Optional[np.ndarray] = None,
+                 interval_s: Optional[float] = DEFAULT_INTERVAL_S) -> Dict[str, float]:
+    # Same precedence as decide_action: urgent pump, else ML (when available), else pump rules;
+    # urgent fan, else fan rules. `ml_pump` is the model output for every row (it does not depend
+    # on the thresholds, so it is computed once per chunk and shared by all configurations).
+    soil_moisture, temperature, humidity = sensors.T
+    n = len(sensors)
+    urgent_pump, urgent_fan = check_urgent_conditions_batch(
+        soil_moisture, temperature, humidity, params['critical_soil_moisture'],
+        params['critical_temperature'], params['critical_humidity'])
+    candidates = ~urgent_pump
+    ml_on = candidates & ml_pump if ml_pump is not None else np.zeros(n, dtype=bool)
+    rule_on = candidates & ~ml_on & make_normal_pump_decision_rules_batch(
+        soil_moisture, temperature, params['moisture_threshold'], params['temp_max'])
+    rule_fan = ~urgent_fan & check_normal_fan_conditions_batch(
+        temperature, humidity, params['temp_max'], params['humidity_max'])
+
+    # A pump or fan cannot run past the next reading's decision when readings are `interval_s` apart
+    cap = interval_s if interval_s else float('inf')
+    n_urgent_pump, n_ml, n_rule = int(urgent_pump.sum()), int(ml_on.sum()), int(rule_on.sum())
+    n_urgent_fan, n_rule_fan = int(urgent_fan.sum()), int(rule_fan.sum())
+    return {
+        'readings': n,
+        'pump_urgent': n_urgent_pump,
+        'pump_ml': n_ml,
+        'pump_rule': n_rule,
+        'pump_off': n - n_urgent_pump - n_ml - n_rule,
+        'ml_evaluated': int(candidates.sum()) if ml_pump is not None else 0,
+        'fan_urgent': n_urgent_fan,
+        'fan_rule': n_rule_fan,
+        'fan_off': n - n_urgent_fan - n_rule_fan,
+        'pump_seconds': (n_urgent_pump * min(URGENT_PUMP_DURATION_S, cap)
+                         + (n_ml + n_rule) * min(params['pump_duration_s'], cap)),
+        'fan_seconds': n_urgent_fan * min(URGENT_FAN_DURATION_S, cap) + n_rule_fan * min(params['fan_duration_s'], cap),
+    }
+
+
+def summarize(counts: Dict[str, float], params: Dict[str, float], flow_rate_lpm: float) -> dict:
+    readings = counts['readings'] or 1
+    pump_minutes = counts['pump_seconds'] / 60.0
+    return {
+        'parameters': params,
+        'readings': counts['readings'],
+        'pump_minutes': round(pump_minutes, 2),
+        'water_litres': round(pump_minutes * flow_rate_lpm, 2),
+        'fan_minutes': round(counts['fan_seconds'] / 60.0, 2),
+        'pump_paths': {path: counts[f'pump_{path}'] for path in ('urgent', 'ml', 'rule', 'off')},
+        'fan_paths': {path: counts[f'fan_{path}'] for path in ('urgent', 'rule', 'off')},
+        'pump_on_rate': round((counts['pump_urgent'] + counts['pump_ml'] + counts['pump_rule']) / readings, 4),
+        'ml_evaluated': counts['ml_evaluated'],
+    }
+
+
+# --- Parallel execution: chunks are spread over processes, each evaluates every configuration ---
+
+_worker_state = {}
+
+def _init_worker(model_dir: str, model_name: Optional[str], lookup_step: float = 0):
+    bundle = None
+    if model_name:
+        registry = ModelRegistry(model_dir, default_model=model_name, lookup_step=lookup_step)
+        registry.reload([model_name])
+        bundle = registry.get(model_name)
+        if bundle is None:
+            raise RuntimeError(f"Could not load model '{model_name}' from {model_dir}")
+        if bundle.extended:
+            raise RuntimeError(f"Model '{model_name}' needs per-location history and cannot be replayed")
+    _worker_state['bundle'] = bundle
+
+
+def _replay_chunk_all(sensors: np.ndarray, configs: List[Dict[str, float]],
+                      interval_s: Optional[float]) -> List[Dict[str, float]]:
+    bundle = _worker_state.get('bundle')
+    ml_pump = np.asarray(bundle.predict(sensors)) == 1 if bundle is not None else None
+    return [replay_chunk(sensors, params, ml_pump, interval_s) for params in configs]
+
+
+def _accumulate(totals: List[Dict[str, float]], results: List[Dict[str, float]]):
+    for total, result in zip(totals, results):
+        for name in COUNT_NAMES:
+            total[name] += result[name]
+
+
+def run_replay(chunks: Iterator[np.ndarray], configs: List[Dict[str, float]], model_name: Optional[str],
+               model_dir: str = MODEL_DIR, jobs: int = 1, interval_s: Optional[float] = DEFAULT_INTERVAL_S,
+               flow_rate_lpm: float = 1.0, lookup_step: float = 0) -> List[dict]:
+    totals = [dict.fromkeys(COUNT_NAMES, 0) for _ in configs]
+    # Loading here first reports model errors before any worker starts and builds a missing
+    # lookup table once, so the workers only map the saved file.
+    _init_worker(model_dir, model_name, lookup_step)
+    if jobs <= 1:
+        for sensors in chunks:
+            _accumulate(totals, _replay_chunk_all(sensors, configs, interval_s))
+    else:
+        # At most two chunks per worker are in flight, so memory does not grow with the file size
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(model_dir, model_name, lookup_step)) as executor:
+            pending = []
+            for sensors in chunks:
+                pending.append(executor.submit(_replay_chunk_all, sensors, configs, interval_s))
+                if len(pending) >= 2 * jobs:
+                    _accumulate(totals, pending.pop(0).result())
+            for future in pending:
+                _accumulate(totals, future.result())
+    return [summarize(total, params, flow_rate_lpm) for total, params in zip(totals, configs)]
+
+
+def parameter_grid(args) -> List[Dict[str, float]]:
+    names = list(DEFAULT_PARAMETERS)
+    values = [getattr(args, name) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay the decision pipeline over historical sensor data.")
+    parser.add_argument('--data', default=os.path.join(SCRIPT_DIR, '..', 'data', 'data.csv'),
+                        help="History CSV: training data or an exported MoistureRecord/DHT20Record dump")
+    parser.add_argument('--format', choices=sorted(HISTORY_FORMATS), default=None,
+                        help="Column layout of --data (detected from the header by default)")
+    parser.add_argument('--cache', default=None,
+                        help="Dataset cache directory (see dataset_cache.py); --data is ingested into it "
+                             "incrementally and the replay reads the memory-mapped columns")
+    parser.add_argument('--model', default=os.getenv('DEFAULT_MODEL', 'pump_random_forest'))
+    parser.add_argument('--no-model', action='store_true', help="Replay with the rule engine only")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--lookup-step', type=float, default=0,
+                        help="Answer the model from its precomputed lookup table with this grid step (see lookup_table.py)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--interval-s', type=float, default=DEFAULT_INTERVAL_S,
+                        help="Seconds between readings; caps each pump/fan run at this length (0: no cap)")
+    parser.add_argument('--flow-rate-lpm', type=float, default=1.0, help="Pump flow rate (litres/minute)")
+    parser.add_argument('--output', default=None, help="Also write the results as JSON to this path")
+    # Every threshold accepts several values; the sweep runs all combinations in one pass
+    for name, default in DEFAULT_PARAMETERS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, nargs='+', default=[default])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    configs = parameter_grid(args)
+    started = time.perf_counter()
+    if args.cache:
+        cache = DatasetCache(args.cache)
+        cache.ingest(args.data, args.format, args.chunk_size)
+        chunks = iter_cached_sensor_chunks(cache, args.chunk_size)
+    else:
+        chunks = iter_sensor_chunks(args.data, args.chunk_size, args.format)
+    results = run_replay(chunks, configs,
+                         None if args.no_model else args.model, args.model_dir, args.jobs,
+                         args.interval_s, args.flow_rate_lpm, args.lookup_step)
+    elapsed = time.perf_counter() - started
+
+    swept = [name for name in DEFAULT_PARAMETERS if len(getattr(args, name)) > 1]
+    print(f"Replayed {results[0]['readings'] if results else 0} readings x {len(configs)} configuration(s) "
+          f"in {elapsed:.2f}s (model: {'none' if args.no_model else args.model})")
+    for result in results:
+        label = ", ".join(f"{name}={result['parameters'][name]:g}" for name in swept) or "defaults"
+        pump, fan = result['pump_paths'], result['fan_paths']
+        print(f"  {label:<50} pump {result['pump_minutes']:>10.1f} min  water {result['water_litres']:>10.1f} L  "
+              f"fan {result['fan_minutes']:>10.1f} min  | pump urgent/ml/rule/off "
+              f"{pump['urgent']}/{pump['ml']}/{pump['rule']}/{pump['off']}  fan urgent/rule/off "
+              f"{fan['urgent']}/{fan['rule']}/{fan['off']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'data': args.data, 'model': None if args.no_model else args.model,
+                       'elapsed_s': elapsed, 'results': results}, f, indent=2)
@@ -1,4 +1,5 @@
-from typing import Optional
+from typing import Optional, Tuple
+import numpy as np
 try:
     from .models import SensorData, ConfigurationData, DecisionResponse
 except ImportError:
@@ -22,15 +23,31 @@ URGENT_FAN_DURATION_S = 600
 DEFAULT_PUMP_DURATION_S = 300
 DEFAULT_FAN_DURATION_S = 300
 
+TEMP_SAFETY_MARGIN = 2
+
+# --- Rule predicates on plain floats (shared by the pydantic API below and the lean decision core) ---
+
+def is_urgent_pump(soil_moisture: float) -> bool:
+    return soil_moisture < CRITICAL_SOIL_MOISTURE
+
+def is_urgent_fan(temperature: float, humidity: float) -> bool:
+    return temperature > CRITICAL_TEMPERATURE or humidity > CRITICAL_HUMIDITY
+
+def needs_fan(temperature: float, humidity: float, temp_max: float, humidity_max: float) -> bool:
+    return temperature > temp_max or humidity > humidity_max
+
+def needs_pump(soil_moisture: float, temperature: float, moisture_threshold: float, temp_max: float) -> bool:
+    return soil_moisture < moisture_threshold and temperature < (temp_max - TEMP_SAFETY_MARGIN)
+
 def check_urgent_conditions(sensor_data: SensorData, config: ConfigurationData) -> Optional[DecisionResponse]:
     soil_moisture = sensor_data.soilMoisture
     temperature = sensor_data.temperature
     humidity = sensor_data.humidity
 
-    if soil_moisture < CRITICAL_SOIL_MOISTURE:
+    if is_urgent_pump(soil_moisture):
         return DecisionResponse(action=ACTION_PUMP_ON, duration=URGENT_PUMP_DURATION_S, urgency=URGENCY_URGENT)
 
-    if temperature > CRITICAL_TEMPERATURE or humidity > CRITICAL_HUMIDITY:
+    if is_urgent_fan(temperature, humidity):
         return DecisionResponse(action=ACTION_FAN_ON, duration=URGENT_FAN_DURATION_S, urgency=URGENCY_URGENT)
 
     return None
@@ -41,7 +58,7 @@ def check_normal_fan_conditions(sensor_data: SensorData, config: ConfigurationDa
     temp_max = config.tempMax
     humidity_max = config.humidityMax
 
-    if temperature > temp_max or humidity > humidity_max:
+    if needs_fan(temperature, humidity, temp_max, humidity_max):
         fan_duration_config = getattr(config, 'fanDuration', DEFAULT_FAN_DURATION_S)
         return DecisionResponse(action=ACTION_FAN_ON, duration=fan_duration_config, urgency=URGENCY_NORMAL)
 
@@ -52,10 +69,43 @@ def make_normal_pump_decision_rules(sensor_data: SensorData, config: Configurati
     temperature = sensor_data.temperature
     moisture_threshold = config.moistureThreshold
     temp_max = config.tempMax
-    temp_safety_margin = 2
 
-    if soil_moisture < moisture_threshold and temperature < (temp_max - temp_safety_margin):
+    if needs_pump(soil_moisture, temperature, moisture_threshold, temp_max):
         pump_duration_config = getattr(config, 'pumpDuration', DEFAULT_PUMP_DURATION_S)
         return DecisionResponse(action=ACTION_PUMP_ON, duration=pump_duration_config, urgency=URGENCY_NORMAL)
 
-    return DecisionResponse(action=ACTION_PUMP_OFF, duration=0, urgency=URGENCY_NORMAL)
\ No newline at end of file
+    return DecisionResponse(action=ACTION_PUMP_OFF, duration=0, urgency=URGENCY_NORMAL)
+
+# --- Vectorized variants (one boolean mask per rule over a whole batch) ---
+
+def check_urgent_conditions_batch(soil_moisture: np.ndarray, temperature: np.ndarray, humidity: np.ndarray,
+                                  critical_soil_moisture: float = CRITICAL_SOIL_MOISTURE,
+                                  critical_temperature: float = CRITICAL_TEMPERATURE,
+                                  critical_humidity: float = CRITICAL_HUMIDITY) -> Tuple[np.ndarray, np.ndarray]:
+    # Same precedence as check_urgent_conditions: an urgent pump hides an urgent fan.
+    urgent_pump = soil_moisture < critical_soil_moisture
+    urgent_fan = ~urgent_pump & ((temperature > critical_temperature) | (humidity > critical_humidity))
+    return urgent_pump, urgent_fan
+
+def check_normal_fan_conditions_batch(temperature: np.ndarray, humidity: np.ndarray,
+                                      temp_max: np.ndarray, humidity_max: np.ndarray) -> np.ndarray:
+    return (temperature > temp_max) | (humidity > humidity_max)
+
+def make_normal_pump_decision_rules_batch(soil_moisture: np.ndarray, temperature: np.ndarray,
+                                          moisture_threshold: np.ndarray, temp_max: np.ndarray) -> np.ndarray:
+    return (soil_moisture < moisture_threshold) & (temperature < (temp_max - TEMP_SAFETY_MARGIN))
+
+def rule_signature(sensor_data: SensorData, config: ConfigurationData) -> Tuple[bool, ...]:
+    # Outcome of every rule comparison; two inputs with equal signatures get identical rule decisions.
+    soil_moisture = sensor_data.soilMoisture
+    temperature = sensor_data.temperature
+    humidity = sensor_data.humidity
+    return (
+        soil_moisture < CRITICAL_SOIL_MOISTURE,
+        temperature > CRITICAL_TEMPERATURE,
+        humidity > CRITICAL_HUMIDITY,
+        temperature > config.tempMax,
+        humidity > config.humidityMax,
+        soil_moisture < config.moistureThreshold,
+        temperature < (config.tempMax - TEMP_SAFETY_MARGIN),
+    )
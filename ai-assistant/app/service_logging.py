@@ -0,0 +1,115 @@
+import os
+import sys
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Optional
+
+from .rule_engine import URGENCY_URGENT
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_handler: Optional["NonBlockingQueueHandler"] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Hands records to the writer thread without formatting them: messages are rendered there, so
+    # a record costs the caller one queue put. Callers pass plain values as %-style arguments
+    # (never objects they mutate later). Records arriving while `max_size` are waiting are counted
+    # and dropped, so a stalled writer cannot make the service run out of memory.
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks are rendered now, while the frames still describe the failure
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+def configure_logging(level: Optional[str] = None, queue_size: Optional[int] = None):
+    # Replaces logging.basicConfig for the service: the root logger only enqueues, and a
+    # QueueListener thread formats and writes to stderr. Like basicConfig it leaves a root logger
+    # that already has handlers alone.
+    global _handler, _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    queue_size = queue_size if queue_size is not None else int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(logging.Formatter(LOG_FORMAT))
+    # SimpleQueue: an unlocked C queue, so a put costs the caller next to nothing
+    _handler = NonBlockingQueueHandler(queue.SimpleQueue(), queue_size)
+    _listener = logging.handlers.QueueListener(_handler.queue, writer, respect_handler_level=True)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _listener.start()
+    atexit.register(stop_logging)
+    # The writer thread does not survive a fork (gunicorn preload), so every worker starts its own
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def _restart_after_fork():
+    if _listener is None:
+        return
+    # Fresh queue as well: another thread of the parent may have held the old queue's lock
+    _handler.queue = _listener.queue = queue.SimpleQueue()
+    _listener._thread = None
+    _listener.start()
+
+
+def stop_logging():
+    # Flushes queued records; safe to call more than once
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def logging_stats() -> dict:
+    if _handler is None:
+        return {"queued": False}
+    return {"queued": True, "queue_depth": _handler.queue.qsize(), "queue_size": _handler.max_size,
+            "dropped": _handler.dropped}
+
+
+class DecisionLog:
+    # One record per decision on the `app.decisions` logger. Urgent decisions are always written;
+    # routine ones with probability `sample_rate`.
+    def __init__(self, sample_rate: float = 1.0, logger_name: str = 'app.decisions'):
+        self.sample_rate = sample_rate
+        self.logger = logging.getLogger(logger_name)
+        self.logged = 0
+        self.sampled_out = 0
+
+    def log(self, endpoint: str, reading, result, pump_source: str, fan_source: str, model_name: Optional[str]):
+        # `reading` is a DecisionInput, `result` the DecisionResult sent back for it
+        urgent = result[2] == URGENCY_URGENT or result[5] == URGENCY_URGENT
+        if not urgent and (self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate)):
+            self.sampled_out += 1
+            return
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        self.logged += 1
+        self.logger.info(
+            "decision endpoint=%s location=%s pump=%s pump_duration=%s pump_urgency=%s pump_source=%s "
+            "fan=%s fan_duration=%s fan_urgency=%s fan_source=%s next_check_s=%s "
+            "soil=%.2f temp=%.2f hum=%.2f model=%s",
+            endpoint, reading.locationId, result[0], result[1], result[2], pump_source,
+            result[3], result[4], result[5], fan_source, result[6],
+            reading.soilMoisture, reading.temperature, reading.humidity, model_name)
+
+    def stats(self) -> dict:
+        return {"sample_rate": self.sample_rate, "logged": self.logged, "sampled_out": self.sampled_out}
@@ -1,22 +1,68 @@
 import pandas as pd
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, cross_validate, StratifiedKFold, ParameterGrid, ParameterSampler
 from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.tree import DecisionTreeClassifier
 from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import time
 import joblib
 import os
 import numpy as np
 
+try:
+    from .feature_store import ALL_FEATURES, DEFAULT_WINDOW, MAX_MINUTES_SINCE_PUMP
+    from .dataset_cache import DatasetCache
+except ImportError:
+    from feature_store import ALL_FEATURES, DEFAULT_WINDOW, MAX_MINUTES_SINCE_PUMP
+    from dataset_cache import DatasetCache
+
 DATA_PATH = '../data/data.csv'
 MODEL_DIR = '../models_trained'
 SCALER_PATH = os.path.join(MODEL_DIR, 'pump_scaler.joblib')
 LR_MODEL_PATH = os.path.join(MODEL_DIR, 'pump_logistic_regression.joblib')
 RF_MODEL_PATH = os.path.join(MODEL_DIR, 'pump_random_forest.joblib')
+RF_COMPILED_PATH = os.path.join(MODEL_DIR, 'pump_random_forest.npz')
+SGD_MODEL_PATH = os.path.join(MODEL_DIR, 'pump_sgd_logistic.joblib')
+SGD_SCALER_PATH = os.path.join(MODEL_DIR, 'pump_sgd_logistic_scaler.joblib')
+EXT_MODEL_PATH = os.path.join(MODEL_DIR, 'pump_random_forest_ext.joblib')
+EXT_SCALER_PATH = os.path.join(MODEL_DIR, 'pump_random_forest_ext_scaler.joblib')
+EXT_COMPILED_PATH = os.path.join(MODEL_DIR, 'pump_random_forest_ext.npz')
+# Cột bắt buộc cho --extended: mã vị trí và thời điểm đo (datetime hoặc Unix giây)
+LOCATION_COLUMN = 'Location'
+TIME_COLUMN = 'Timestamp'
 RANDOM_STATE = 42
 TEST_SIZE = 0.2
+FEATURES = ['Soil Moisture', 'Temperature', 'Air Humidity']
+TARGET = 'Pump Data'
+SOIL_MOISTURE_DIVISOR = 12.0
+DEFAULT_CHUNK_SIZE = 100_000
+SEARCH_RESULTS_PATH = os.path.join(MODEL_DIR, 'pump_search_results.json')
+
+# Không gian tìm kiếm: tên artifact -> (lớp mô hình, lưới tham số)
+SEARCH_SPACE = {
+    'pump_logistic_regression': (LogisticRegression, {
+        'C': [0.01, 0.1, 1.0, 10.0],
+    }),
+    'pump_decision_tree': (DecisionTreeClassifier, {
+        'max_depth': [3, 5, 8],
+        'min_samples_leaf': [1, 10, 30],
+    }),
+    'pump_random_forest': (RandomForestClassifier, {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [3, 5, 8],
+        'min_samples_leaf': [1, 10, 30],
+    }),
+    'pump_gradient_boosting': (HistGradientBoostingClassifier, {
+        'max_iter': [50, 100],
+        'max_depth': [3, None],
+        'learning_rate': [0.05, 0.1],
+    }),
+}
 
 os.makedirs(MODEL_DIR, exist_ok=True)
 
@@ -34,7 +80,27 @@ def load_data(path):
         print(f"Lỗi khi tải dữ liệu: {e}")
         return None
 
-def preprocess_data(df):
+def load_cached_data(cache_dir, source=None):
+    # Nạp thêm (chỉ phần dữ liệu mới của) file nguồn vào cache cột rồi đọc qua memory-map, không parse lại CSV
+    try:
+        cache = DatasetCache(cache_dir)
+        if source:
+            added = cache.ingest(source)
+            print(f"Đã thêm {added} dòng mới từ {source} vào cache {cache_dir}")
+        df = cache.to_frame()
+        print(f"Tải dữ liệu từ cache: {cache_dir} ({df.shape[0]} dòng có nhãn)")
+        return df
+    except Exception as e:
+        print(f"Lỗi khi tải dữ liệu từ cache: {e}")
+        return None
+
+def _import_plotting():
+    # Chỉ import matplotlib/seaborn khi thật sự vẽ, để chế độ --no-plots chạy được trên máy không có GUI
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+def preprocess_data(df, show_plots=True):
     if df is None:
         return None, None, None, None, None, None
 
@@ -60,8 +126,10 @@ def preprocess_data(df):
 
     # Biến đổi Soil Moisture
     print("\n--- Chia giá trị 'Soil Moisture' cho 10 ---")
-    if 'Soil Moisture' in df.columns:
-        df['Soil Moisture'] = df['Soil Moisture'] / 12.0
+    if df.attrs.get('cleaned'):
+        print("Dữ liệu từ cache đã được chia sẵn.")
+    elif 'Soil Moisture' in df.columns:
+        df['Soil Moisture'] = df['Soil Moisture'] / SOIL_MOISTURE_DIVISOR
         print("'Soil Moisture' đã được chia cho 10.")
     else:
         print("CẢNH BÁO: Không tìm thấy cột 'Soil Moisture' để chia.")
@@ -78,28 +146,32 @@ def preprocess_data(df):
         print("CẢNH BÁO: Dữ liệu có vẻ mất cân bằng.")
 
     # --- BỔ SUNG: Trực quan hóa & Phân tích tương quan ---
-    features = ['Soil Moisture', 'Temperature', 'Air Humidity']
-    target = 'Pump Data'
+    features = FEATURES
+    target = TARGET
+    if show_plots:
+        plt, sns = _import_plotting()
 
     # 1. Trực quan hóa phân phối của các features
-    print("\n--- Trực quan hóa phân phối Features (trước Standard Scaling) ---")
-    plt.figure(figsize=(18, 5))
-    for i, col in enumerate(features):
-        plt.subplot(1, len(features), i + 1)
-        sns.histplot(df[col], kde=True, bins=30)
-        plt.title(f'Phân phối {col}')
-    plt.tight_layout()
-    plt.show() # Hiển thị đồ thị
+    if show_plots:
+        print("\n--- Trực quan hóa phân phối Features (trước Standard Scaling) ---")
+        plt.figure(figsize=(18, 5))
+        for i, col in enumerate(features):
+            plt.subplot(1, len(features), i + 1)
+            sns.histplot(df[col], kde=True, bins=30)
+            plt.title(f'Phân phối {col}')
+        plt.tight_layout()
+        plt.show() # Hiển thị đồ thị
 
     # 2. Tính toán và trực quan hóa ma trận tương quan
     print("\n--- Tính toán và trực quan hóa ma trận tương quan ---")
     # Chọn các cột số để tính tương quan (bao gồm cả target)
     cols_for_corr = features + [target]
     correlation_matrix = df[cols_for_corr].corr()
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=.5)
-    plt.title('Ma trận tương quan các biến')
-    plt.show() # Hiển thị đồ thị
+    if show_plots:
+        plt.figure(figsize=(8, 6))
+        sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=.5)
+        plt.title('Ma trận tương quan các biến')
+        plt.show() # Hiển thị đồ thị
 
     # 3. Phân tích tương quan với biến mục tiêu
     print("\n--- Phân tích tương quan giữa Features và Target (Pump Data) ---")
@@ -117,7 +189,7 @@ def preprocess_data(df):
         print(f"Không có feature nào có tương quan tuyệt đối >= {strong_corr_threshold} với target.")
 
     # 4. Trực quan hóa mối quan hệ giữa Feature quan trọng và Target (ví dụ: Soil Moisture)
-    if 'Soil Moisture' in features:
+    if show_plots and 'Soil Moisture' in features:
         print("\n--- Trực quan hóa Soil Moisture vs Pump Data ---")
         plt.figure(figsize=(10, 6))
         sns.boxplot(data=df, x=target, y='Soil Moisture')
@@ -183,30 +255,438 @@ def save_pipeline(model, scaler, model_path, scaler_path):
         print(f"Đã lưu mô hình vào: {model_path}")
         joblib.dump(scaler, scaler_path)
         print(f"Đã lưu scaler vào: {scaler_path}")
+        # Service ưu tiên <tên>_scaler.joblib hơn scaler dùng chung: khi lưu với scaler dùng chung,
+        # xóa scaler riêng cũ (vd. do --search xuất) để mô hình mới không bị ghép với scaler khác
+        own_scaler_path = os.path.splitext(model_path)[0] + '_scaler.joblib'
+        if os.path.abspath(scaler_path) != os.path.abspath(own_scaler_path) and os.path.exists(own_scaler_path):
+            os.remove(own_scaler_path)
+            print(f"Đã xóa scaler riêng cũ: {own_scaler_path}")
     except Exception as e:
         print(f"Lỗi khi lưu mô hình/scaler: {e}")
 
+def export_compiled_forest(model, scaler, path, X_check=None):
+    # Gói scaler + toàn bộ cây thành các mảng phẳng để service suy luận bằng NumPy (không cần sklearn)
+    try:
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(tree.node_count)
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            # Nút lá trỏ về chính nó để mọi cây có thể duyệt đồng bộ tới max_depth bước
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            leaf_values = tree.value[:, 0, :]
+            values.append(leaf_values / leaf_values.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+
+        max_depth = max(estimator.tree_.max_depth for estimator in model.estimators_)
+        feature_names = getattr(scaler, 'feature_names_in_', None)
+        extra = {'feature_names': np.asarray(feature_names, dtype=str)} if feature_names is not None else {}
+        np.savez(
+            path,
+            scaler_mean=scaler.mean_,
+            scaler_scale=scaler.scale_,
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(np.int32),
+            children_right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=model.classes_,
+            max_depth=np.int32(max_depth),
+            **extra,
+        )
+        print(f"Đã xuất mô hình rút gọn (NumPy) vào: {path}")
+
+        if X_check is not None:
+            try:
+                from .forest_engine import load_compiled_forest
+            except ImportError:
+                from forest_engine import load_compiled_forest
+            compiled_scaler, compiled_model = load_compiled_forest(path)
+            agreement = np.mean(
+                compiled_model.predict(compiled_scaler.transform(np.asarray(X_check, dtype=np.float64)))
+                == model.predict(scaler.transform(X_check)))
+            print(f"Tỷ lệ khớp giữa mô hình rút gọn và sklearn: {agreement * 100:.2f}%")
+    except Exception as e:
+        print(f"Lỗi khi xuất mô hình rút gọn: {e}")
+
+# --- Huấn luyện dạng stream (theo từng chunk) cho lịch sử cảm biến lớn ---
+
+def clean_chunk(chunk):
+    if chunk.attrs.get('cleaned'):
+        # Dữ liệu từ DatasetCache đã được làm sạch và chia sẵn
+        return chunk
+    chunk = chunk.replace([np.inf, -np.inf], np.nan).dropna(subset=FEATURES + [TARGET])
+    chunk['Soil Moisture'] = chunk['Soil Moisture'] / SOIL_MOISTURE_DIVISOR
+    return chunk
+
+def iter_clean_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, cache=None):
+    if cache is not None:
+        for start, stop in cache.iter_ranges(chunk_size):
+            chunk = cache.to_frame(start, stop)
+            if len(chunk):
+                yield chunk
+        return
+    for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=FEATURES + [TARGET]):
+        chunk = clean_chunk(chunk)
+        if len(chunk):
+            yield chunk
+
+def is_test_row(row_index):
+    # Chia train/test ổn định theo chỉ số dòng (hash), không cần giữ toàn bộ dữ liệu trong bộ nhớ
+    hashed = (np.asarray(row_index, dtype=np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+    return hashed < np.uint64(TEST_SIZE * 2 ** 32)
+
+def train_streaming(path, chunk_size=DEFAULT_CHUNK_SIZE, epochs=3, cache=None):
+    print(f"\n--- Huấn luyện dạng stream từ {path} (chunk = {chunk_size} dòng, {epochs} epoch) ---")
+
+    # Lượt 1: thống kê scaler tăng dần
+    scaler = StandardScaler()
+    n_train = n_test = 0
+    for chunk in iter_clean_chunks(path, chunk_size, cache):
+        test_mask = is_test_row(chunk.index)
+        train = chunk[~test_mask]
+        if len(train):
+            scaler.partial_fit(train[FEATURES])
+        n_train += len(train)
+        n_test += int(test_mask.sum())
+    if n_train == 0:
+        print("LỖI: Không có dữ liệu huấn luyện hợp lệ.")
+        return None, None
+    print(f"Đã tính thống kê scaler trên {n_train} dòng train ({n_test} dòng test).")
+
+    # Lượt 2..n: SGD logistic regression với partial_fit trên từng chunk đã xáo trộn
+    model = SGDClassifier(loss='log_loss', random_state=RANDOM_STATE)
+    classes = np.array([0, 1])
+    rng = np.random.default_rng(RANDOM_STATE)
+    for epoch in range(epochs):
+        for chunk in iter_clean_chunks(path, chunk_size, cache):
+            train = chunk[~is_test_row(chunk.index)]
+            if not len(train):
+                continue
+            order = rng.permutation(len(train))
+            X = scaler.transform(train[FEATURES])[order]
+            y = train[TARGET].to_numpy()[order]
+            model.partial_fit(X, y, classes=classes)
+        print(f"Hoàn tất epoch {epoch + 1}/{epochs}")
+
+    # Đánh giá trên tập test, chỉ cộng dồn ma trận nhầm lẫn
+    cm = np.zeros((2, 2), dtype=np.int64)
+    for chunk in iter_clean_chunks(path, chunk_size, cache):
+        test = chunk[is_test_row(chunk.index)]
+        if len(test):
+            y_pred = model.predict(scaler.transform(test[FEATURES]))
+            cm += confusion_matrix(test[TARGET], y_pred, labels=classes)
+    if cm.sum():
+        print(f"\n--- Đánh giá mô hình: SGD Logistic Regression (stream) ---")
+        print(f"Accuracy: {np.trace(cm) / cm.sum():.4f}")
+        print("\nConfusion Matrix:")
+        print(cm)
+    return model, scaler
+
+# --- Mô hình mở rộng với đặc trưng trượt theo thời gian (khớp với app/feature_store.py) ---
+
+def build_extended_features(df, window=DEFAULT_WINDOW):
+    # Đặc trưng trượt chỉ có nghĩa trên lịch sử đo thật của từng vị trí, theo thời gian. Các dòng
+    # không có vị trí/thời điểm (như data/data.csv) là các mẫu độc lập: không được coi là chuỗi liên tiếp.
+    missing = [column for column in (LOCATION_COLUMN, TIME_COLUMN) if column not in df.columns]
+    if missing:
+        print(f"LỖI: --extended cần lịch sử đo có thời gian của từng vị trí; dữ liệu thiếu cột {missing}.")
+        return None, None
+    df = clean_chunk(df.copy())
+    times = df[TIME_COLUMN]
+    times = pd.to_datetime(times, unit='s') if pd.api.types.is_numeric_dtype(times) else pd.to_datetime(times)
+    df['_minutes'] = (times - times.min()).dt.total_seconds() / 60.0
+    df = df.sort_values([LOCATION_COLUMN, '_minutes'], kind='stable').reset_index(drop=True)
+    location = df[LOCATION_COLUMN]
+    # Thời gian tính từ lần đo đầu tiên của vị trí, như trong service
+    df['_minutes'] -= df.groupby(location)['_minutes'].transform('min')
+    df['_tm'] = df['_minutes'] * df['Soil Moisture']
+    df['_tt'] = df['_minutes'] ** 2
+
+    def rolling(columns, how):
+        return getattr(df.groupby(location)[columns].rolling(window, min_periods=1), how)().reset_index(level=0, drop=True)
+
+    averages = rolling(['Soil Moisture', 'Temperature', 'Air Humidity'], 'mean')
+    # Độ dốc bình phương tối thiểu trên cửa sổ, từ các tổng trượt như feature_store.LocationHistory
+    sums = rolling(['_minutes', 'Soil Moisture', '_tm', '_tt'], 'sum')
+    n = rolling('_minutes', 'count')
+    denominator = n * sums['_tt'] - sums['_minutes'] ** 2
+    slope = ((n * sums['_tm'] - sums['_minutes'] * sums['Soil Moisture']) / denominator.where(denominator > 1e-9))
+    # Thời gian từ lần bơm gần nhất *trước* lần đo hiện tại (service cập nhật đặc trưng trước khi quyết định)
+    last_pump = df['_minutes'].where(df[TARGET] == 1).groupby(location).shift(1).groupby(location).ffill()
+    since_pump = (df['_minutes'] - last_pump).clip(upper=MAX_MINUTES_SINCE_PUMP).fillna(MAX_MINUTES_SINCE_PUMP)
+
+    extended = pd.DataFrame({
+        'Soil Moisture': df['Soil Moisture'],
+        'Temperature': df['Temperature'],
+        'Air Humidity': df['Air Humidity'],
+        'Moisture Slope': slope.fillna(0.0),
+        'Moisture MA': averages['Soil Moisture'],
+        'Temperature MA': averages['Temperature'],
+        'Humidity MA': averages['Air Humidity'],
+        'Minutes Since Pump': since_pump,
+    })[ALL_FEATURES]
+    return extended, df[TARGET]
+
+def train_extended(df, window=DEFAULT_WINDOW):
+    print(f"\n--- Huấn luyện mô hình mở rộng (cửa sổ {window} lần đo) ---")
+    X, y = build_extended_features(df, window)
+    if X is None or len(X) == 0:
+        print("LỖI: Không có dữ liệu hợp lệ.")
+        return None, None, None
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y)
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    model = train_random_forest(X_train_scaled, y_train)
+    evaluate_model(model, "Random Forest (mở rộng)", X_test_scaled, y_test)
+    return model, scaler, X_test
+
+# --- Tìm kiếm siêu tham số song song & so sánh mô hình ---
+
+_search_data = {}
+
+def _init_search_worker(X_train, y_train):
+    # Mỗi process nhận dữ liệu một lần; giới hạn 1 luồng BLAS/OpenMP để không tranh chấp CPU giữa các process
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+    _search_data['X_train'] = X_train
+    _search_data['y_train'] = y_train
+
+def _make_candidate(family, params):
+    estimator_cls, _ = SEARCH_SPACE[family]
+    return Pipeline([('scaler', StandardScaler()), ('model', estimator_cls(random_state=RANDOM_STATE, **params))])
+
+def _evaluate_candidate(family, params, cv_folds):
+    X_train, y_train = _search_data['X_train'], _search_data['y_train']
+    cv = StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=RANDOM_STATE)
+    scores = cross_validate(_make_candidate(family, params), X_train, y_train, cv=cv, scoring='accuracy')
+    pipeline = _make_candidate(family, params)
+    started = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    return {
+        'family': family,
+        'params': params,
+        'cv_accuracy': float(np.mean(scores['test_score'])),
+        'cv_accuracy_std': float(np.std(scores['test_score'])),
+        'cv_fit_time_s': float(np.mean(scores['fit_time'])),
+        'fit_time_s': time.perf_counter() - started,
+    }, pipeline
+
+def _measure_latency(pipeline, X_test, repeats):
+    # Đo trong process chính sau khi pool kết thúc để kết quả không bị nhiễu bởi các process khác
+    single_row = X_test.iloc[:1]
+    pipeline.predict(single_row)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        pipeline.predict(single_row)
+        timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    pipeline.predict(X_test)
+    batch_per_row = (time.perf_counter() - started) / len(X_test)
+    return float(np.median(timings)) * 1e6, batch_per_row * 1e6
+
+def _pareto_front(results):
+    front = set()
+    for i, a in enumerate(results):
+        dominated = any(
+            b['cv_accuracy'] >= a['cv_accuracy'] and b['latency_single_us'] <= a['latency_single_us']
+            and (b['cv_accuracy'] > a['cv_accuracy'] or b['latency_single_us'] < a['latency_single_us'])
+            for b in results)
+        if not dominated:
+            front.add(i)
+    return front
+
+def run_model_search(df, cv_folds=5, n_jobs=None, n_iter=None, accuracy_tolerance=0.005,
+                     max_latency_us=None, latency_repeats=50):
+    df = clean_chunk(df)
+    X, y = df[FEATURES], df[TARGET]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y)
+
+    candidates = []
+    for family, (_, grid) in SEARCH_SPACE.items():
+        if n_iter:
+            params_list = list(ParameterSampler(grid, n_iter=min(n_iter, len(ParameterGrid(grid))),
+                                                random_state=RANDOM_STATE))
+        else:
+            params_list = list(ParameterGrid(grid))
+        candidates.extend((family, params) for params in params_list)
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    print(f"\n--- Tìm kiếm {len(candidates)} cấu hình trên {n_jobs} process ({cv_folds}-fold CV) ---")
+    results, pipelines = [], []
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_search_worker,
+                             initargs=(X_train, y_train)) as pool:
+        futures = [pool.submit(_evaluate_candidate, family, params, cv_folds) for family, params in candidates]
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                result, pipeline = future.result()
+            except Exception as e:
+                print(f"Lỗi khi đánh giá một cấu hình: {e}")
+                continue
+            results.append(result)
+            pipelines.append(pipeline)
+            print(f"[{done}/{len(candidates)}] {result['family']} {result['params']} "
+                  f"-> CV accuracy {result['cv_accuracy']:.4f}")
+
+    if not results:
+        print("LỖI: Không có cấu hình nào được huấn luyện thành công.")
+        return None, None
+
+    print("\n--- Đo độ trễ suy luận & độ chính xác trên tập test ---")
+    for result, pipeline in zip(results, pipelines):
+        result['latency_single_us'], result['latency_batch_per_row_us'] = _measure_latency(
+            pipeline, X_test, latency_repeats)
+        result['test_accuracy'] = float(accuracy_score(y_test, pipeline.predict(X_test)))
+    for i in _pareto_front(results):
+        results[i]['pareto_optimal'] = True
+
+    # Chọn mô hình: trong các cấu hình có CV accuracy cách tốt nhất không quá `accuracy_tolerance`
+    # (và thỏa giới hạn độ trễ nếu có), lấy cấu hình có độ trễ một dòng thấp nhất
+    eligible = [r for r in results if max_latency_us is None or r['latency_single_us'] <= max_latency_us]
+    if not eligible:
+        print(f"CẢNH BÁO: Không có mô hình nào có độ trễ <= {max_latency_us} µs, bỏ qua giới hạn độ trễ.")
+        eligible = results
+    best_accuracy = max(r['cv_accuracy'] for r in eligible)
+    best_index = min(
+        (i for i, r in enumerate(results) if r in eligible and r['cv_accuracy'] >= best_accuracy - accuracy_tolerance),
+        key=lambda i: results[i]['latency_single_us'])
+    results[best_index]['selected'] = True
+
+    print(f"\n{'Mô hình':<26}{'CV acc':>8}{'Test acc':>10}{'Fit (s)':>9}{'1 dòng (µs)':>13}{'Batch/dòng (µs)':>17}  Tham số")
+    for r in sorted(results, key=lambda r: (-r['cv_accuracy'], r['latency_single_us'])):
+        marker = '*' if r.get('selected') else ('P' if r.get('pareto_optimal') else ' ')
+        print(f"{marker}{r['family']:<25}{r['cv_accuracy']:>8.4f}{r['test_accuracy']:>10.4f}{r['fit_time_s']:>9.3f}"
+              f"{r['latency_single_us']:>13.1f}{r['latency_batch_per_row_us']:>17.2f}  {r['params']}")
+    print("(* = được chọn, P = nằm trên biên Pareto độ chính xác/độ trễ)")
+
+    try:
+        with open(SEARCH_RESULTS_PATH, 'w') as f:
+            json.dump({'created_at': time.time(), 'n_train': len(X_train), 'n_test': len(X_test),
+                       'cv_folds': cv_folds, 'results': results}, f, indent=2, default=str)
+        print(f"Đã lưu kết quả tìm kiếm vào: {SEARCH_RESULTS_PATH}")
+    except Exception as e:
+        print(f"Lỗi khi lưu kết quả tìm kiếm: {e}")
+
+    return results[best_index], pipelines[best_index]
+
+def export_best_pipeline(result, pipeline, X_check=None):
+    # Chỉ xuất mô hình tốt nhất, kèm scaler riêng của nó (<tên>_scaler.joblib)
+    family = result['family']
+    scaler, model = pipeline.named_steps['scaler'], pipeline.named_steps['model']
+    save_pipeline(model, scaler,
+                  os.path.join(MODEL_DIR, f'{family}.joblib'),
+                  os.path.join(MODEL_DIR, f'{family}_scaler.joblib'))
+    compiled_path = os.path.join(MODEL_DIR, f'{family}.npz')
+    if isinstance(model, RandomForestClassifier):
+        export_compiled_forest(model, scaler, compiled_path, X_check)
+    elif os.path.exists(compiled_path):
+        # Artifact rút gọn cũ sẽ được service ưu tiên hơn mô hình vừa lưu
+        os.remove(compiled_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Huấn luyện mô hình dự đoán bật bơm.")
+    parser.add_argument('--data', default=DATA_PATH, help="Đường dẫn file CSV dữ liệu cảm biến")
+    parser.add_argument('--no-plots', action='store_true', help="Không vẽ đồ thị (chạy headless)")
+    parser.add_argument('--cache', default=None,
+                        help="Thư mục cache dạng cột (memory-map); --data chỉ được nạp phần mới rồi đọc từ cache thay vì parse CSV")
+    parser.add_argument('--stream', action='store_true',
+                        help="Đọc dữ liệu theo chunk và huấn luyện out-of-core (bộ nhớ không tăng theo dữ liệu)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Số dòng mỗi chunk")
+    parser.add_argument('--epochs', type=int, default=3, help="Số lượt duyệt dữ liệu ở chế độ --stream")
+    parser.add_argument('--search', action='store_true',
+                        help="Tìm kiếm siêu tham số song song trên nhiều họ mô hình và chỉ xuất mô hình tốt nhất")
+    parser.add_argument('--jobs', type=int, default=None, help="Số process cho --search (mặc định: tất cả CPU)")
+    parser.add_argument('--cv', type=int, default=5, help="Số fold cross-validation cho --search")
+    parser.add_argument('--n-iter', type=int, default=None,
+                        help="Lấy ngẫu nhiên tối đa N cấu hình mỗi họ mô hình thay vì duyệt toàn bộ lưới")
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.005,
+                        help="Chấp nhận giảm CV accuracy tối đa chừng này để đổi lấy mô hình nhanh hơn")
+    parser.add_argument('--max-latency-us', type=float, default=None,
+                        help="Giới hạn độ trễ suy luận một dòng (µs) khi chọn mô hình")
+    parser.add_argument('--extended', action='store_true',
+                        help="Huấn luyện mô hình mở rộng dùng thêm đặc trưng trượt (xu hướng độ ẩm, trung bình, thời gian từ lần bơm); "
+                             f"dữ liệu phải có cột '{LOCATION_COLUMN}' và '{TIME_COLUMN}'")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help="Số lần đo trong cửa sổ trượt (phải khớp FEATURE_WINDOW của service)")
+    args = parser.parse_args()
+    if args.extended and args.cache:
+        # Cache chỉ lưu các cột cảm biến và nhãn, không có cột vị trí/thời điểm mà --extended cần
+        parser.error(f"--extended không dùng được với --cache: cache không lưu cột '{LOCATION_COLUMN}' "
+                     f"và '{TIME_COLUMN}'. Hãy truyền trực tiếp file CSV qua --data.")
+    return args
+
+def load_input(args):
+    return load_cached_data(args.cache, args.data) if args.cache else load_data(args.data)
+
 if __name__ == "__main__":
-    data_df = load_data(DATA_PATH)
+    args = parse_args()
+
+    if args.stream:
+        stream_cache = None
+        if args.cache:
+            stream_cache = DatasetCache(args.cache)
+            print(f"Đã thêm {stream_cache.ingest(args.data)} dòng mới từ {args.data} vào cache {args.cache}")
+        sgd_model, sgd_scaler = train_streaming(args.data, args.chunk_size, args.epochs, stream_cache)
+        if sgd_model is not None:
+            save_pipeline(sgd_model, sgd_scaler, SGD_MODEL_PATH, SGD_SCALER_PATH)
+            print("\n--- Quá trình huấn luyện (stream) hoàn tất ---")
+        else:
+            print("\n--- Dừng lại do lỗi ở bước huấn luyện stream ---")
+    elif args.extended:
+        data_df = load_input(args)
+        if data_df is not None:
+            ext_model, ext_scaler, X_check = train_extended(data_df, args.window)
+            if ext_model is not None:
+                save_pipeline(ext_model, ext_scaler, EXT_MODEL_PATH, EXT_SCALER_PATH)
+                export_compiled_forest(ext_model, ext_scaler, EXT_COMPILED_PATH, X_check)
+                print("\n--- Quá trình huấn luyện mô hình mở rộng hoàn tất ---")
+        else:
+            print("\n--- Dừng lại do lỗi ở bước tải dữ liệu ---")
+    elif args.search:
+        data_df = load_input(args)
+        if data_df is not None:
+            best_result, best_pipeline = run_model_search(
+                data_df, cv_folds=args.cv, n_jobs=args.jobs, n_iter=args.n_iter,
+                accuracy_tolerance=args.accuracy_tolerance, max_latency_us=args.max_latency_us)
+            if best_result is not None:
+                print(f"\nMô hình được chọn: {best_result['family']} {best_result['params']}")
+                export_best_pipeline(best_result, best_pipeline, clean_chunk(data_df)[FEATURES])
+                print("\n--- Quá trình tìm kiếm mô hình hoàn tất ---")
+        else:
+            print("\n--- Dừng lại do lỗi ở bước tải dữ liệu ---")
+    else:
+        data_df = load_input(args)
 
-    if data_df is not None:
-        X_train_scaled, X_test_scaled, y_train, y_test, scaler, feature_names = preprocess_data(data_df)
+        if data_df is not None:
+            X_train_scaled, X_test_scaled, y_train, y_test, scaler, feature_names = preprocess_data(
+                data_df, show_plots=not args.no_plots)
 
-        if X_train_scaled is not None and scaler is not None:
-            print("\nBắt đầu huấn luyện và đánh giá...")
+            if X_train_scaled is not None and scaler is not None:
+                print("\nBắt đầu huấn luyện và đánh giá...")
 
-            lr_model = train_logistic_regression(X_train_scaled, y_train)
-            evaluate_model(lr_model, "Logistic Regression", X_test_scaled, y_test)
-            save_pipeline(lr_model, scaler, LR_MODEL_PATH, SCALER_PATH)
+                lr_model = train_logistic_regression(X_train_scaled, y_train)
+                evaluate_model(lr_model, "Logistic Regression", X_test_scaled, y_test)
+                save_pipeline(lr_model, scaler, LR_MODEL_PATH, SCALER_PATH)
 
-            print("\n" + "="*50 + "\n")
+                print("\n" + "="*50 + "\n")
 
-            rf_model = train_random_forest(X_train_scaled, y_train)
-            evaluate_model(rf_model, "Random Forest", X_test_scaled, y_test)
-            save_pipeline(rf_model, scaler, RF_MODEL_PATH, SCALER_PATH)
+                rf_model = train_random_forest(X_train_scaled, y_train)
+                evaluate_model(rf_model, "Random Forest", X_test_scaled, y_test)
+                save_pipeline(rf_model, scaler, RF_MODEL_PATH, SCALER_PATH)
+                export_compiled_forest(rf_model, scaler, RF_COMPILED_PATH, scaler.inverse_transform(X_test_scaled))
 
-            print("\n--- Quá trình huấn luyện và đánh giá hoàn tất ---")
+                print("\n--- Quá trình huấn luyện và đánh giá hoàn tất ---")
+            else:
+                print("\n--- Dừng lại do lỗi ở bước tiền xử lý dữ liệu ---")
         else:
-            print("\n--- Dừng lại do lỗi ở bước tiền xử lý dữ liệu ---")
-    else:
-        print("\n--- Dừng lại do lỗi ở bước tải dữ liệu ---")
\ No newline at end of file
+            print("\n--- Dừng lại do lỗi ở bước tải dữ liệu ---")
\ No newline at end of file
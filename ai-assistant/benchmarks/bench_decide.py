@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+AI_ASSISTANT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if AI_ASSISTANT_DIR not in sys.path:
+    sys.path.insert(0, AI_ASSISTANT_DIR)
+
+from app.models import SensorData, ConfigurationData
+from app.rule_engine import check_urgent_conditions, check_normal_fan_conditions, make_normal_pump_decision_rules
+from app.decision_core import BINARY_MEDIA_TYPE, DecisionInput, encode_request
+
+RESULTS_DIR = os.path.join(AI_ASSISTANT_DIR, 'benchmarks', 'results')
+TARGETS = ('rules', 'ml', 'inprocess', 'binary', 'batch', 'http')
+
+
+# --- Synthetic load ---
+
+def make_payloads(n: int, locations: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(n):
+        payloads.append({
+            "locationId": f"bench-{i % locations}",
+            "sensorData": {
+                "soilMoisture": round(rng.uniform(0, 100), 2),
+                "temperature": round(rng.uniform(10, 45), 2),
+                "humidity": round(rng.uniform(20, 100), 2),
+            },
+            "configuration": {
+                "moistureThreshold": round(rng.uniform(20, 60), 1),
+                "tempMin": None,
+                "tempMax": round(rng.uniform(28, 38), 1),
+                "humidityMax": round(rng.uniform(70, 95), 1),
+            },
+        })
+    return payloads
+
+
+def summarize(latencies_s: List[float], wall_s: float, errors: int = 0, requests_per_item: int = 1) -> dict:
+    latencies_ms = np.asarray(latencies_s, dtype=np.float64) * 1000.0
+    completed = len(latencies_ms)
+    if completed == 0:
+        return {"completed": 0, "errors": errors}
+    return {
+        "completed": completed,
+        "errors": errors,
+        "wall_s": round(wall_s, 4),
+        "throughput_rps": round(completed * requests_per_item / wall_s, 1) if wall_s > 0 else None,
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 4),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 4),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 4),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 4),
+            "max": round(float(latencies_ms.max()), 4),
+        },
+    }
+
+
+# --- Function-level benchmarks ---
+
+def time_calls(fn: Callable, inputs: list, warmup: int) -> dict:
+    for args in inputs[:warmup]:
+        fn(*args)
+    latencies = []
+    perf_counter = time.perf_counter
+    started = perf_counter()
+    for args in inputs:
+        t0 = perf_counter()
+        fn(*args)
+        latencies.append(perf_counter() - t0)
+    return summarize(latencies, perf_counter() - started)
+
+
+def bench_rules(payloads: List[dict], warmup: int) -> Dict[str, dict]:
+    inputs = [(SensorData(**p["sensorData"]), ConfigurationData(**p["configuration"])) for p in payloads]
+    return {
+        "check_urgent_conditions": time_calls(check_urgent_conditions, inputs, warmup),
+        "check_normal_fan_conditions": time_calls(check_normal_fan_conditions, inputs, warmup),
+        "make_normal_pump_decision_rules": time_calls(make_normal_pump_decision_rules, inputs, warmup),
+    }
+
+
+def bench_ml(payloads: List[dict], warmup: int) -> Dict[str, dict]:
+    from app.main import MODEL_DIR
+    from app.model_registry import ModelRegistry
+    from app.feature_store import features_without_history
+
+    registry = ModelRegistry(MODEL_DIR, default_model='')
+    registry.reload()
+    inputs = [(np.array([[p["sensorData"]["soilMoisture"], p["sensorData"]["temperature"],
+                          p["sensorData"]["humidity"]]]),) for p in payloads]
+    # Extended models also take the rolling features; rows are timed as a location's first reading
+    extended_inputs = [(features_without_history(X),) for X, in inputs]
+    results = {}
+    for name in registry.names():
+        bundle = registry.get(name)
+        results[f"{name} ({bundle.backend})"] = time_calls(
+            bundle.predict, extended_inputs if bundle.extended else inputs, warmup)
+    return results
+
+
+# --- HTTP benchmarks (in-process ASGI or a live server) ---
+
+def _post(client, path: str, body):
+    # Pre-encoded bodies go to the binary endpoint as-is
+    if isinstance(body, bytes):
+        return client.post(path, content=body, headers={"content-type": BINARY_MEDIA_TYPE})
+    return client.post(path, json=body)
+
+
+async def run_load(client, path: str, bodies: list, warmup_bodies: list, concurrency: int) -> dict:
+    # Warm-up bodies are distinct from timed ones so they cannot pre-fill the decision cache
+    for body in warmup_bodies:
+        await _post(client, path, body)
+
+    latencies: List[float] = []
+    status_codes: Dict[int, int] = {}
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        perf_counter = time.perf_counter
+        while next_index < len(bodies):
+            body = bodies[next_index]
+            next_index += 1
+            t0 = perf_counter()
+            try:
+                response = await _post(client, path, body)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(perf_counter() - t0)
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_s = time.perf_counter() - started
+
+    items = len(bodies[0]) if bodies and isinstance(bodies[0], list) else 1
+    summary = summarize(latencies, wall_s, errors, requests_per_item=items)
+    summary["status_codes"] = {str(code): count for code, count in sorted(status_codes.items())}
+    if items > 1:
+        summary["decisions_per_request"] = items
+    return summary
+
+
+async def bench_inprocess(payloads: List[dict], warmup_payloads: List[dict], concurrency: int,
+                          batch_size: Optional[int], binary: bool = False) -> dict:
+    import httpx
+    from app.main import app
+
+    path, bodies = _http_bodies(payloads, batch_size, binary)
+    _, warmup_bodies = _http_bodies(warmup_payloads, batch_size, binary)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_load(client, path, bodies, warmup_bodies, concurrency)
+
+
+async def bench_http(payloads: List[dict], warmup_payloads: List[dict], concurrency: int,
+                     batch_size: Optional[int], url: str) -> dict:
+    import httpx
+
+    path, bodies = _http_bodies(payloads, batch_size)
+    _, warmup_bodies = _http_bodies(warmup_payloads, batch_size)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        return await run_load(client, path, bodies, warmup_bodies, concurrency)
+
+
+def _http_bodies(payloads: List[dict], batch_size: Optional[int], binary: bool = False):
+    if binary:
+        # Encoded up front: the benchmark measures the service, not the client's encoding
+        return "/decide/bin", [encode_request(DecisionInput(
+            p["locationId"], **p["sensorData"], **p["configuration"])) for p in payloads]
+    if batch_size:
+        return "/decide/batch", [payloads[i:i + batch_size] for i in range(0, len(payloads), batch_size)]
+    return "/decide", payloads
+
+
+def start_local_server(port: int, startup_timeout_s: float = 60.0) -> subprocess.Popen:
+    import httpx
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=AI_ASSISTANT_DIR, env={**os.environ, "PORT": str(port)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + startup_timeout_s
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"uvicorn did not become healthy within {startup_timeout_s}s")
+
+
+# --- Reporting ---
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=AI_ASSISTANT_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+    }
+
+
+def print_report(results: Dict[str, dict], baseline: Optional[dict] = None):
+    baseline_results = (baseline or {}).get("results", {})
+    print(f"\n{'Benchmark':<58}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, summary in results.items():
+        latency = summary.get("latency_ms", {})
+        line = (f"{name:<58}{summary.get('throughput_rps') or 0:>10.1f}{latency.get('p50', 0):>10.4f}"
+                f"{latency.get('p95', 0):>10.4f}{latency.get('p99', 0):>10.4f}{summary.get('errors', 0):>8}")
+        previous = baseline_results.get(name, {}).get("latency_ms", {}).get("p99")
+        if previous and latency.get("p99"):
+            line += f"   p99 {(latency['p99'] / previous - 1) * 100:+.1f}% vs baseline"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmarks for the decision service "
+                                                 "(dependencies: pip install -r benchmarks/requirements.txt).")
+    parser.add_argument("targets", nargs="*", default=["rules", "ml", "inprocess"],
+                        help=f"What to benchmark: {', '.join(TARGETS)} (default: rules ml inprocess)")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of synthetic decisions")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent in-flight HTTP requests")
+    parser.add_argument("--batch-size", type=int, default=100, help="Decisions per /decide/batch call ('batch' target)")
+    parser.add_argument("--locations", type=int, default=200, help="Distinct locationIds in the synthetic load")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed warm-up calls per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", default=None,
+                        help="Base URL of a running service for the 'http' target (default: start a local uvicorn)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the locally started uvicorn")
+    parser.add_argument("--output", default=None, help="Where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare p99 latency against")
+    args = parser.parse_args()
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s) {unknown}; choose from {', '.join(TARGETS)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    # The service's logging setup resets the root level on import; keep the client's per-request lines out
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    payloads = make_payloads(args.requests, args.locations, args.seed)
+    warmup_payloads = make_payloads(args.warmup, args.locations, args.seed + 1)
+    results: Dict[str, dict] = {}
+
+    for target in args.targets:
+        print(f"Running '{target}' benchmark...")
+        if target == "rules":
+            results.update({f"rules/{k}": v for k, v in bench_rules(payloads, args.warmup).items()})
+        elif target == "ml":
+            results.update({f"ml/{k}": v for k, v in bench_ml(payloads, args.warmup).items()})
+        elif target == "inprocess":
+            results[f"inprocess/decide c={args.concurrency}"] = asyncio.run(
+                bench_inprocess(payloads, warmup_payloads, args.concurrency, None))
+        elif target == "binary":
+            results[f"inprocess/decide_bin c={args.concurrency}"] = asyncio.run(
+                bench_inprocess(payloads, warmup_payloads, args.concurrency, None, binary=True))
+        elif target == "batch":
+            results[f"inprocess/decide_batch n={args.batch_size} c={args.concurrency}"] = asyncio.run(
+                bench_inprocess(payloads, warmup_payloads, args.concurrency, args.batch_size))
+        elif target == "http":
+            server = None if args.url else start_local_server(args.port)
+            url = args.url or f"http://127.0.0.1:{args.port}"
+            try:
+                results[f"http/decide c={args.concurrency}"] = asyncio.run(
+                    bench_http(payloads, warmup_payloads, args.concurrency, None, url))
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait(timeout=10)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import os
+import multiprocessing
+
+# Production server: several uvicorn workers behind gunicorn, sharing models loaded once in the master.
+# Development keeps using `uvicorn --reload` (see docker-compose.yaml).
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8001')}"
+# Per-worker state: the feature store, decision cache and check scheduler. Extended models read a
+# location's rolling history from the feature store, so they need WEB_CONCURRENCY=1 or a proxy
+# that routes by locationId. GET /schedule/due only sees the answering worker's locations, so a
+# client using it needs WEB_CONCURRENCY=1 as well; the
+# next_check_s hint in every decision works with any number of workers. Admin changes (model
+# reloads, location assignments) reach every worker through files in models_trained, picked up by
+# each worker's model watcher (MODEL_WATCH_INTERVAL_S, must be > 0 with several workers).
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Exported so the app (imported after this file) knows how many workers share the traffic
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import app.main (and load the models, see when_ready) in the master before forking.
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is spawned.
+    from app.main import preload_models
+    preload_models()